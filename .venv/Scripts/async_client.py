@@ -0,0 +1,210 @@
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from client import build_message, callback_arguments
+from protocol import FrameDecoder, ProtocolError, RECV_SIZE, encode_frame, handshake
+from registry import is_pattern, matches
+
+
+class AsyncSPClientAPI:
+    # Wariant SPClientAPI dla asyncio. Zapisy trafiają do bufora StreamWriter (kilka produce() = jeden zapis),
+    # drain() wywoływany co batch_size komunikatów albo w flush(). Każdy temat ma własną ograniczoną kolejkę
+    # i zadanie wywołujące callbacki po kolei; callback może być zwykłą funkcją albo korutyną. Zwykłe funkcje
+    # działają w puli callback_workers wątków, żeby nie blokować pętli zdarzeń (callback_workers=0 - w pętli).
+    # create_subscriber(..., metadata=True) - callback(payload, metadata) jak w SPClientAPI.
+    def __init__(self, batch_size=100, callback_workers=4, callback_queue_size=1000):
+        self.client_id = None
+        self.reader = None
+        self.writer = None
+        self.connected = False
+        self.topics_produced = set()
+        self.topics_subscribed = {}
+        self.with_metadata = set()
+        self.decoder = None
+        self.batch_size = batch_size
+        self.unflushed = 0
+        self.callback_workers = callback_workers
+        self.callback_queue_size = callback_queue_size
+        self.executor = None
+        self.callback_queues = {}  # temat -> asyncio.Queue
+        self.tasks = set()
+        self.status_waiters = []
+
+    async def start(self, server_ip, server_port, client_id):
+        self.client_id = client_id
+        try:
+            self.reader, self.writer = await asyncio.open_connection(server_ip, server_port)
+        except OSError as e:
+            print(f'Error connecting to server: {e}')
+            return
+        self.writer.write(handshake())
+        self.decoder = FrameDecoder()
+        self.connected = True
+        if self.callback_workers:
+            self.executor = ThreadPoolExecutor(max_workers=self.callback_workers)
+        print(f'Connected to server {server_ip}:{server_port}')
+        self.spawn(self.listen_to_server())
+
+    def is_connected(self):
+        return self.connected
+
+    def spawn(self, coroutine):
+        task = asyncio.get_running_loop().create_task(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    async def send_message(self, message):
+        self.writer.write(encode_frame(message))
+        self.unflushed += 1
+        if self.unflushed >= self.batch_size:
+            await self.flush()
+
+    async def flush(self):
+        # Zwraca, gdy bufor zapisu spadł poniżej progu StreamWriter - dane są w jądrze
+        if self.writer is None:
+            return
+        try:
+            await self.writer.drain()
+        except ConnectionError as e:
+            print(f'Error sending message: {e}')
+            self.connected = False
+        self.unflushed = 0
+
+    async def get_server_status(self):
+        waiter = asyncio.get_running_loop().create_future()
+        self.status_waiters.append(waiter)
+        await self.send_message(build_message("status", self.client_id, "logs", "producer", {}))
+        await self.flush()
+        return await waiter
+
+    async def create_producer(self, topic_name):
+        await self.send_message(build_message("register", self.client_id, topic_name, "producer", {}))
+        self.topics_produced.add(topic_name)
+
+    async def produce(self, topic_name, payload):
+        if topic_name not in self.topics_produced:
+            print(f'Error: Not producing topic {topic_name}')
+            return
+        await self.send_message(build_message("message", self.client_id, topic_name, "producer", payload))
+
+    async def produce_many(self, topic_name, payloads):
+        if topic_name not in self.topics_produced:
+            print(f'Error: Not producing topic {topic_name}')
+            return
+        for payload in payloads:
+            self.writer.write(encode_frame(build_message("message", self.client_id, topic_name, "producer", payload)))
+        await self.flush()
+
+    async def withdraw_producer(self, topic_name):
+        if topic_name in self.topics_produced:
+            await self.send_message(build_message("withdraw", self.client_id, topic_name, "producer", {}))
+            self.topics_produced.remove(topic_name)
+        else:
+            print(f'Error: Not producing topic {topic_name}')
+
+    async def create_subscriber(self, topic_name, callback, offset=None, since=None, metadata=False):
+        payload = {}
+        if offset is not None:
+            payload["offset"] = offset
+        elif since is not None:
+            payload["since"] = since if isinstance(since, str) else since.isoformat()
+        self.topics_subscribed[topic_name] = callback
+        if metadata:
+            self.with_metadata.add(topic_name)
+        else:
+            self.with_metadata.discard(topic_name)
+        await self.send_message(build_message("register", self.client_id, topic_name, "subscriber", payload))
+        await self.flush()
+
+    async def withdraw_subscriber(self, topic_name):
+        if topic_name in self.topics_subscribed:
+            await self.send_message(build_message("withdraw", self.client_id, topic_name, "subscriber", {}))
+            del self.topics_subscribed[topic_name]
+            self.with_metadata.discard(topic_name)
+        else:
+            print(f'Error: Not subscribed to topic {topic_name}')
+
+    async def stop(self):
+        if self.connected:
+            await self.flush()
+        self.connected = False
+        for task in list(self.tasks):
+            task.cancel()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except ConnectionError:
+                pass
+        self.topics_produced.clear()
+        self.topics_subscribed.clear()
+        self.with_metadata.clear()
+        print('Client stopped and disconnected from server')
+
+    async def listen_to_server(self):
+        try:
+            while self.connected:
+                data = await self.reader.read(RECV_SIZE)
+                if not data:
+                    break
+                for message in self.decoder.feed(data):
+                    await self.handle_server_message(json.loads(message))
+        except ProtocolError as e:
+            print(f'Protocol error: {e}')
+        except ConnectionError as e:
+            print(f'Error receiving message from server: {e}')
+        finally:
+            self.connected = False
+
+    async def handle_server_message(self, message_data):
+        if message_data["type"] == "status" and message_data["topic"] == "logs":
+            waiters, self.status_waiters = self.status_waiters, []
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_result(message_data["payload"])
+            return
+        topic = message_data.get("topic")
+        callbacks = self.callbacks_for(topic)
+        if not callbacks:
+            print(f'Received message on unregistered topic: {topic}')
+            return
+        tasks = self.callback_queues.get(topic)
+        if tasks is None:
+            tasks = self.callback_queues[topic] = asyncio.Queue(maxsize=self.callback_queue_size)
+            self.spawn(self.callback_worker(tasks))
+        # Pełna kolejka wstrzymuje odczyt z gniazda - backpressure aż do serwera
+        for callback, metadata in callbacks:
+            await tasks.put((callback, callback_arguments(message_data, metadata)))
+
+    def callbacks_for(self, topic):
+        if topic in self.topics_subscribed:
+            return [(self.topics_subscribed[topic], topic in self.with_metadata)]
+        return [(callback, pattern in self.with_metadata) for pattern, callback in list(self.topics_subscribed.items())
+                if is_pattern(pattern) and matches(pattern, topic)]
+
+    async def callback_worker(self, tasks):
+        loop = asyncio.get_running_loop()
+        while True:
+            callback, args = await tasks.get()
+            try:
+                if asyncio.iscoroutinefunction(callback) or self.executor is None:
+                    result = callback(*args)
+                else:
+                    # Czekamy na wynik - następny callback tematu startuje dopiero po tym
+                    result = await loop.run_in_executor(self.executor, callback, *args)
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception as e:
+                print(f'Error in subscriber callback: {e}')
+            finally:
+                tasks.task_done()
+
+    async def join(self):
+        # Czeka na wykonanie wszystkich odebranych dotąd callbacków
+        for tasks in list(self.callback_queues.values()):
+            await tasks.join()
@@ -0,0 +1,421 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from client import SPClientAPI
+
+try:
+    import psutil
+except ImportError:  # Bez psutil zużycie serwera czytamy z /proc (tylko Linux)
+    psutil = None
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server.py')
+
+# producers / subscribers - liczba procesów, topics - tematów na producenta,
+# rate - komunikatów/s na producenta (None = bez ograniczenia), churn - procesy łączące się i rozłączające w pętli
+SCENARIOS = {
+    'fanout': {'producers': 1, 'subscribers': 8, 'topics': 1, 'payload_size': 100, 'rate': None, 'churn': 0},
+    'fanin': {'producers': 8, 'subscribers': 1, 'topics': 1, 'payload_size': 100, 'rate': None, 'churn': 0},
+    'many_topics': {'producers': 4, 'subscribers': 4, 'topics': 250, 'payload_size': 100, 'rate': None, 'churn': 0},
+    'churn': {'producers': 1, 'subscribers': 2, 'topics': 1, 'payload_size': 100, 'rate': 2000, 'churn': 4},
+    'large_payload': {'producers': 1, 'subscribers': 2, 'topics': 1, 'payload_size': 512 * 1024, 'rate': None,
+                      'churn': 0},
+}
+
+
+def topic_name(producer, index):
+    return f'bench/{producer}/{index}'
+
+
+def quiet():
+    # Klienci i serwer drukują każdy komunikat - w pomiarze tylko przeszkadza
+    sys.stdout = open(os.devnull, 'w')
+
+
+def producer_process(port, index, settings, ready, go, results):
+    quiet()
+    client = SPClientAPI(linger_ms=settings['linger_ms'], batch_size=settings['batch_size'], callback_workers=0)
+    client.start('127.0.0.1', port, f'bench-producer-{index}')
+    topics = [topic_name(index, topic) for topic in range(settings['topics'])]
+    for topic in topics:
+        client.create_producer(topic)
+    client.flush()
+    ready.release()
+    go.wait()
+    data = 'x' * settings['payload_size']
+    interval = 1 / settings['rate'] if settings['rate'] else 0
+    sent = 0
+    started = time.time()
+    deadline = started + settings['duration']
+    next_send = started
+    while client.is_connected():
+        now = time.time()
+        if now >= deadline:
+            break
+        if interval:
+            if now < next_send:
+                time.sleep(next_send - now)
+            next_send += interval
+        client.produce(topics[sent % len(topics)], {'sent': time.time(), 'seq': sent, 'data': data})
+        sent += 1
+    client.flush(timeout=10)
+    elapsed = time.time() - started
+    results.put({'role': 'producer', 'messages': sent, 'bytes': sent * len(data), 'elapsed': elapsed})
+    time.sleep(settings['drain'])  # Rozłączenie producenta usuwa jego tematy - czekamy aż subskrybenci odbiorą
+    client.stop()
+
+
+def subscriber_process(port, index, settings, ready, go, stop, results):
+    quiet()
+    latencies = []
+    received = {'messages': 0, 'bytes': 0}
+
+    def on_message(payload):
+        latencies.append(time.time() - payload['sent'])
+        received['messages'] += 1
+        received['bytes'] += len(payload['data'])
+
+    client = SPClientAPI(callback_workers=0)  # Callback w wątku odbioru - opóźnienie bez kolejki puli
+    client.start('127.0.0.1', port, f'bench-subscriber-{index}')
+    for producer in range(settings['producers']):
+        for topic in range(settings['topics']):
+            # Przy wielu tematach każdy subskrybent bierze swoją część, inaczej subskrybuje wszystko
+            if settings['topics'] == 1 or topic % settings['subscribers'] == index % settings['subscribers']:
+                client.create_subscriber(topic_name(producer, topic), on_message)
+    ready.release()
+    go.wait()
+    stop.wait()
+    client.stop()
+    results.put({'role': 'subscriber', 'messages': received['messages'], 'bytes': received['bytes'],
+                 'latencies': latencies})
+
+
+def churn_process(port, index, settings, go, stop, results):
+    quiet()
+    go.wait()
+    cycles = 0
+    started = time.time()
+    while not stop.is_set():
+        client = SPClientAPI(callback_workers=0)
+        client.start('127.0.0.1', port, f'bench-churn-{index}-{cycles}')
+        if not client.is_connected():
+            break
+        client.create_subscriber(topic_name(0, 0), lambda payload: None)
+        client.stop()
+        cycles += 1
+    results.put({'role': 'churn', 'cycles': cycles, 'elapsed': time.time() - started})
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def start_server(settings, directory):
+    port = free_port()
+    config = dict(settings['server_config'])
+    config.update({'ServerID': 'bench', 'Host': '127.0.0.1', 'Port': port})
+    config_path = os.path.join(directory, 'config.json')
+    with open(config_path, 'w') as file:
+        json.dump(config, file)
+    # Własna grupa procesów - przy Workers > 1 trzeba zatrzymać też procesy workerów
+    process = subprocess.Popen([sys.executable, SERVER_SCRIPT, config_path], cwd=directory,
+                               stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                               start_new_session=os.name == 'posix')
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            time.sleep(0.2 if config.get('Workers', 1) == 1 else 1)
+            return process, port
+        except OSError:
+            time.sleep(0.05)
+    stop_server(process)
+    raise RuntimeError('Server did not start listening')
+
+
+def stop_server(process):
+    if os.name == 'posix':
+        try:
+            os.killpg(process.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    else:
+        process.terminate()
+    try:
+        process.wait(timeout=5)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+class ServerMonitor:
+    # Zużycie pamięci i CPU serwera razem z procesami workerów
+    def __init__(self, pid):
+        self.pid = pid
+        self.peak_rss = 0
+        self.started = time.time()
+        self.cpu_start = self.cpu_seconds()
+
+    def processes(self):
+        if psutil is not None:
+            try:
+                root = psutil.Process(self.pid)
+                return [root] + root.children(recursive=True)
+            except psutil.Error:
+                return []
+        pids = [self.pid]
+        for name in os.listdir('/proc'):
+            if name.isdigit() and proc_stat(name)[1] == self.pid:
+                pids.append(int(name))
+        return pids
+
+    def cpu_seconds(self):
+        total = 0.0
+        for process in self.processes():
+            if psutil is not None:
+                try:
+                    times = process.cpu_times()
+                    total += times.user + times.system
+                except psutil.Error:
+                    pass
+            else:
+                fields, _ = proc_stat(process)
+                if fields:
+                    total += (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+        return total
+
+    def rss(self):
+        total = 0
+        for process in self.processes():
+            if psutil is not None:
+                try:
+                    total += process.memory_info().rss
+                except psutil.Error:
+                    pass
+            else:
+                try:
+                    with open(f'/proc/{process}/statm') as file:
+                        total += int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+                except OSError:
+                    pass
+        return total
+
+    def sample(self):
+        self.peak_rss = max(self.peak_rss, self.rss())
+
+    def report(self):
+        cpu = self.cpu_seconds() - self.cpu_start
+        elapsed = time.time() - self.started
+        return {
+            'peak_rss_bytes': self.peak_rss,
+            'cpu_seconds': round(cpu, 3),
+            'cpu_percent': round(100 * cpu / elapsed, 1) if elapsed else 0.0,
+        }
+
+
+def proc_stat(pid):
+    # Pola /proc/<pid>/stat po nazwie procesu; zwraca (pola, ppid)
+    try:
+        with open(f'/proc/{pid}/stat') as file:
+            fields = file.read().rsplit(')', 1)[1].split()
+        return fields, int(fields[1])
+    except (OSError, IndexError, ValueError):
+        return None, None
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def run_scenario(name, settings):
+    context = multiprocessing.get_context()
+    results = context.Queue()
+    ready = context.Semaphore(0)
+    go = context.Event()
+    stop = context.Event()
+    directory = tempfile.mkdtemp(prefix=f'bench-{name}-')
+    server, port = start_server(settings, directory)
+    processes = []
+    try:
+        # Tematy muszą istnieć przed rejestracją subskrybentów
+        for index in range(settings['producers']):
+            processes.append(context.Process(target=producer_process, args=(port, index, settings, ready, go, results)))
+            processes[-1].start()
+        for _ in range(settings['producers']):
+            ready.acquire(timeout=30)
+        for index in range(settings['subscribers']):
+            processes.append(context.Process(target=subscriber_process,
+                                             args=(port, index, settings, ready, go, stop, results)))
+            processes[-1].start()
+        for _ in range(settings['subscribers']):
+            ready.acquire(timeout=30)
+        for index in range(settings['churn']):
+            processes.append(context.Process(target=churn_process, args=(port, index, settings, go, stop, results)))
+            processes[-1].start()
+        time.sleep(0.5)  # Ostatnie rejestracje docierają do serwera
+        monitor = ServerMonitor(server.pid)
+        go.set()
+        deadline = time.time() + settings['duration'] + settings['drain']
+        while time.time() < deadline:
+            monitor.sample()
+            time.sleep(0.2)
+        server_usage = monitor.report()
+        stop.set()
+        collected = [results.get(timeout=30) for _ in processes]
+        for process in processes:
+            process.join(timeout=10)
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        stop_server(server)
+    return summarize(settings, collected, server_usage)
+
+
+def summarize(settings, collected, server_usage):
+    producers = [result for result in collected if result['role'] == 'producer']
+    subscribers = [result for result in collected if result['role'] == 'subscriber']
+    churn = [result for result in collected if result['role'] == 'churn']
+    elapsed = max((result['elapsed'] for result in producers), default=settings['duration']) or 1
+    sent = sum(result['messages'] for result in producers)
+    received = sum(result['messages'] for result in subscribers)
+    latencies = sorted(latency for result in subscribers for latency in result['latencies'])
+    # Każdy komunikat powinien trafić do tylu subskrybentów, ilu subskrybuje jego temat
+    per_topic = 1 if settings['topics'] > 1 else settings['subscribers']
+    summary = {
+        'settings': {key: value for key, value in settings.items() if key != 'server_config'},
+        'server_config': settings['server_config'],
+        'produced': {
+            'messages': sent,
+            'messages_per_second': round(sent / elapsed, 1),
+            'bytes_per_second': round(sum(result['bytes'] for result in producers) / elapsed, 1),
+        },
+        'delivered': {
+            'messages': received,
+            'messages_per_second': round(received / elapsed, 1),
+            'bytes_per_second': round(sum(result['bytes'] for result in subscribers) / elapsed, 1),
+            'delivery_ratio': round(received / (sent * per_topic), 4) if sent else None,
+        },
+        'latency_ms': {
+            'p50': ms(percentile(latencies, 0.50)),
+            'p99': ms(percentile(latencies, 0.99)),
+            'p999': ms(percentile(latencies, 0.999)),
+            'max': ms(latencies[-1] if latencies else None),
+        },
+        'server': server_usage,
+    }
+    if churn:
+        cycles = sum(result['cycles'] for result in churn)
+        summary['churn'] = {
+            'connections': cycles,
+            'connections_per_second': round(cycles / max(result['elapsed'] for result in churn), 1),
+        }
+    return summary
+
+
+def ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(SERVER_SCRIPT),
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline, tolerance):
+    # Regresja: przepustowość spadła albo p99 wzrosło o więcej niż tolerance
+    regressions = []
+    for name, result in report['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if not previous:
+            continue
+        checks = [
+            ('delivered msgs/s', result['delivered']['messages_per_second'],
+             previous['delivered']['messages_per_second'], False),
+            ('latency p99 ms', result['latency_ms']['p99'], previous['latency_ms']['p99'], True),
+        ]
+        for label, current, old, lower_is_better in checks:
+            if not current or not old:
+                continue
+            change = (current - old) / old
+            print(f'{name}: {label} {old} -> {current} ({change:+.1%})')
+            if (change > tolerance) if lower_is_better else (change < -tolerance):
+                regressions.append(f'{name}: {label}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark brokera publish/subscribe')
+    parser.add_argument('scenarios', nargs='*', default=list(SCENARIOS), help=f'z: {", ".join(SCENARIOS)}')
+    parser.add_argument('--duration', type=float, default=5, help='czas nadawania w sekundach')
+    parser.add_argument('--drain', type=float, default=2, help='czas na odbiór po zakończeniu nadawania')
+    parser.add_argument('--producers', type=int)
+    parser.add_argument('--subscribers', type=int)
+    parser.add_argument('--topics', type=int, help='tematów na producenta')
+    parser.add_argument('--payload-size', type=int)
+    parser.add_argument('--rate', type=float, help='komunikatów/s na producenta')
+    parser.add_argument('--linger-ms', type=float, default=1)
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--config', help='bazowy config.json serwera (ServerMode, Workers, MaxOutbox...)')
+    parser.add_argument('--output', default=f'benchmark-{datetime.now():%Y%m%d-%H%M%S}.json')
+    parser.add_argument('--baseline', help='wcześniejszy wynik JSON do porównania')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='dopuszczalna zmiana względem baseline')
+    args = parser.parse_args()
+
+    server_config = {'ServerMode': 'selectors'}
+    if args.config:
+        with open(args.config) as file:
+            server_config.update(json.load(file))
+    report = {
+        'revision': git_revision(),
+        'timestamp': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'psutil': psutil is not None,
+        'scenarios': {},
+    }
+    for name in args.scenarios:
+        if name not in SCENARIOS:
+            parser.error(f'Unknown scenario: {name}')
+        settings = dict(SCENARIOS[name])
+        for key in ('producers', 'subscribers', 'topics', 'payload_size', 'rate'):
+            if getattr(args, key) is not None:
+                settings[key] = getattr(args, key)
+        settings.update({'duration': args.duration, 'drain': args.drain, 'linger_ms': args.linger_ms,
+                         'batch_size': args.batch_size, 'server_config': server_config})
+        print(f'Benchmark: running {name}...')
+        result = report['scenarios'][name] = run_scenario(name, settings)
+        print(f"Benchmark: {name}: {result['delivered']['messages_per_second']} msgs/s delivered, "
+              f"p50 {result['latency_ms']['p50']} ms, p99 {result['latency_ms']['p99']} ms, "
+              f"delivery ratio {result['delivered']['delivery_ratio']}")
+
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(f'Benchmark: results written to {args.output}')
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(report, json.load(file), args.tolerance)
+        if regressions:
+            print(f'Benchmark: regressions: {", ".join(regressions)}')
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
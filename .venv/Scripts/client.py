@@ -0,0 +1,454 @@
+import socket
+import threading
+import json
+import queue
+import time
+from datetime import datetime
+
+from protocol import FrameDecoder, ProtocolError, RECV_SIZE, encode_frame, handshake
+from registry import is_pattern, matches
+from shard import shard_for
+
+
+def build_message(message_type, client_id, topic, mode, payload):
+    return {
+        "type": message_type,
+        "id": client_id,
+        "topic": topic,
+        "mode": mode,
+        "timestamp": datetime.now().isoformat(),
+        "payload": payload
+    }
+
+
+def callback_arguments(message_data, metadata):
+    # metadata=True w create_subscriber - callback dostaje też offset z dziennika serwera i znacznik czasu
+    if not metadata:
+        return (message_data["payload"],)
+    return (message_data["payload"], {
+        "topic": message_data.get("topic"),
+        "id": message_data.get("id"),
+        "offset": message_data.get("offset"),
+        "timestamp": message_data.get("timestamp")
+    })
+
+
+class CallbackPool:
+    # Callbacki subskrybentów poza wątkiem odbioru. Temat zawsze trafia do tego samego wątku,
+    # więc kolejność w obrębie tematu jest zachowana. Pełna kolejka wstrzymuje odbiór z gniazda.
+    def __init__(self, workers=4, queue_size=1000):
+        self.queues = [queue.Queue(maxsize=max(1, queue_size // workers)) for _ in range(workers)]
+        self.stopped = False
+        for tasks in self.queues:
+            threading.Thread(target=self.worker, args=(tasks,), daemon=True).start()
+
+    def submit(self, topic, callback, *args):
+        if self.stopped:
+            return
+        self.queues[shard_for(topic, len(self.queues))].put((callback, args))
+
+    def worker(self, tasks):
+        while True:
+            task = tasks.get()
+            if task is None or self.stopped:
+                break
+            callback, args = task
+            try:
+                callback(*args)
+            except Exception as e:
+                print(f'Error in subscriber callback: {e}')
+            finally:
+                tasks.task_done()
+
+    def join(self):
+        for tasks in self.queues:
+            tasks.join()
+
+    def stop(self):
+        # Pełna kolejka nie może zablokować stop() - wątek zobaczy flagę po bieżącym callbacku
+        self.stopped = True
+        for tasks in self.queues:
+            try:
+                tasks.put_nowait(None)
+            except queue.Full:
+                pass
+
+
+class SPClientAPI:
+    # linger_ms / batch_size > 1 - komunikaty produce() są zbierane i wysyłane przez osobny wątek
+    # jednym sendall na paczkę. Gdy czeka max_buffered komunikatów (np. serwer wstrzymał producenta),
+    # produce() blokuje jak sendall bez batchingu. callback_workers=0 - callbacki w wątku odbioru (jak dawniej).
+    def __init__(self, linger_ms=0, batch_size=1, callback_workers=4, callback_queue_size=1000, max_buffered=10000):
+        self.server_ip = None
+        self.server_port = None
+        self.client_id = None
+        self.client_socket = None
+        self.connected = False
+        self.topics_produced = set()
+        self.topics_subscribed = {}
+        self.with_metadata = set()  # Subskrypcje, których callback dostaje (payload, metadata)
+        self.lock = threading.Lock()
+        self.decoder = None
+        self.linger = linger_ms / 1000
+        self.batch_size = batch_size
+        self.batch = []  # Zakodowane ramki czekające na wysłanie
+        self.batch_started = None
+        self.batch_ready = threading.Condition()
+        self.max_buffered = max(max_buffered, batch_size)
+        self.queued = 0  # Liczba komunikatów przyjętych do wysłania
+        self.sent = 0  # Liczba komunikatów przekazanych do gniazda
+        self.callback_workers = callback_workers
+        self.callback_queue_size = callback_queue_size
+        self.callbacks = None
+
+    @property
+    def batching(self):
+        return self.linger > 0 or self.batch_size > 1
+
+    def start(self, server_ip, server_port, client_id):
+        self.server_ip = server_ip
+        self.server_port = server_port
+        self.client_id = client_id
+        self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            self.client_socket.connect((self.server_ip, self.server_port))
+            self.client_socket.sendall(handshake())
+            self.decoder = FrameDecoder()
+            self.connected = True
+            print(f'Connected to server {self.server_ip}:{self.server_port}')
+            if self.callback_workers:
+                self.callbacks = CallbackPool(self.callback_workers, self.callback_queue_size)
+            if self.batching:
+                threading.Thread(target=self.sender_thread, daemon=True).start()
+            threading.Thread(target=self.listen_to_server, daemon=True).start()
+        except socket.error as e:
+            print(f'Error connecting to server: {e}')
+            self.connected = False
+
+    def is_connected(self):
+        return self.connected
+
+    def get_status(self):
+        status = {
+            "produced_topics": list(self.topics_produced),
+            "subscribed_topics": list(self.topics_subscribed.keys())
+        }
+        return json.dumps(status, indent=2)
+
+    def get_server_status(self, callback):
+        status_message = {
+            "type": "status",
+            "id": self.client_id,
+            "topic": "logs",
+            "mode": "producer",
+            "timestamp": datetime.now().isoformat(),
+            "payload": {}
+        }
+        self.send_message(status_message)
+        # threading.Thread(target=self.await_server_status_response, args=(callback,), daemon=True).start()
+
+    def create_producer(self, topic_name):
+        register_message = {
+            "type": "register",
+            "id": self.client_id,
+            "topic": topic_name,
+            "mode": "producer",
+            "timestamp": datetime.now().isoformat(),
+            "payload": {}
+        }
+        self.send_message(register_message)
+        self.topics_produced.add(topic_name)
+
+    def produce(self, topic_name, payload):
+        if topic_name in self.topics_produced:
+            message = build_message("message", self.client_id, topic_name, "producer", payload)
+            if self.batching:
+                self.append_batch([encode_frame(message)])
+            else:
+                self.send_message(message)
+                self.queued += 1
+                self.sent += 1
+        else:
+            print(f'Error: Not producing topic {topic_name}')
+
+    def produce_many(self, topic_name, payloads):
+        # Wiele komunikatów jednego tematu - bez batchingu i tak wysyłane jednym sendall
+        if topic_name not in self.topics_produced:
+            print(f'Error: Not producing topic {topic_name}')
+            return
+        frames = [encode_frame(build_message("message", self.client_id, topic_name, "producer", payload))
+                  for payload in payloads]
+        if self.batching:
+            self.append_batch(frames)
+        else:
+            self.send_raw(b''.join(frames))
+            self.queued += len(frames)
+            self.sent += len(frames)
+
+    def append_batch(self, frames, urgent=False):
+        with self.batch_ready:
+            # Wątek wysyłający zabiera całą paczkę naraz, więc czekamy tylko na jej odbiór, nie na sendall
+            while self.batch and len(self.batch) + len(frames) > self.max_buffered and self.connected:
+                self.batch_ready.notify_all()
+                self.batch_ready.wait()
+            if not self.batch:
+                self.batch_started = time.monotonic()
+            self.batch.extend(frames)
+            self.queued += len(frames)
+            if urgent:
+                self.batch_started = 0  # Nie czekamy na linger
+            if urgent or len(self.batch) >= self.batch_size:
+                self.batch_ready.notify_all()
+
+    def sender_thread(self):
+        while self.connected:
+            with self.batch_ready:
+                while not self.batch and self.connected:
+                    self.batch_ready.wait(0.5)
+                # Czekamy na pełną paczkę najwyżej linger_ms od pierwszego komunikatu
+                while self.batch and len(self.batch) < self.batch_size and self.connected:
+                    remaining = self.batch_started + self.linger - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.batch_ready.wait(remaining)
+                batch, self.batch = self.batch, []
+                self.batch_ready.notify_all()
+            if batch:
+                self.send_raw(b''.join(batch))
+                with self.batch_ready:
+                    self.sent += len(batch)
+                    self.batch_ready.notify_all()
+
+    def flush(self, timeout=None):
+        # Czeka, aż wszystkie dotąd przyjęte komunikaty zostaną przekazane do gniazda; False po timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.batch_ready:
+            target = self.queued
+            if self.batch:
+                self.batch_started = 0  # Nie czekamy na linger
+                self.batch_ready.notify_all()
+            while self.sent < target and self.connected:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.batch_ready.wait(remaining)
+            return self.sent >= target
+
+    def withdraw_producer(self, topic_name):
+        if topic_name in self.topics_produced:
+            withdraw_message = {
+                "type": "withdraw",
+                "id": self.client_id,
+                "topic": topic_name,
+                "mode": "producer",
+                "timestamp": datetime.now().isoformat(),
+                "payload": {}
+            }
+            self.send_message(withdraw_message)
+            self.topics_produced.remove(topic_name)
+        else:
+            print(f'Error: Not producing topic {topic_name}')
+
+    def create_subscriber(self, topic_name, callback, offset=None, since=None, metadata=False):
+        # offset / since (datetime lub ISO 8601) - odtworzenie historii tematu z dziennika serwera
+        # metadata=True - callback(payload, {'topic', 'id', 'offset', 'timestamp'}), offset pozwala wznowić odczyt
+        payload = {}
+        if offset is not None:
+            payload["offset"] = offset
+        elif since is not None:
+            payload["since"] = since.isoformat() if isinstance(since, datetime) else since
+        register_message = {
+            "type": "register",
+            "id": self.client_id,
+            "topic": topic_name,
+            "mode": "subscriber",
+            "timestamp": datetime.now().isoformat(),
+            "payload": payload
+        }
+        self.send_message(register_message)
+        self.topics_subscribed[topic_name] = callback
+        if metadata:
+            self.with_metadata.add(topic_name)
+        else:
+            self.with_metadata.discard(topic_name)
+
+    def withdraw_subscriber(self, topic_name):
+        if topic_name in self.topics_subscribed:
+            withdraw_message = {
+                "type": "withdraw",
+                "id": self.client_id,
+                "topic": topic_name,
+                "mode": "subscriber",
+                "timestamp": datetime.now().isoformat(),
+                "payload": {}
+            }
+            self.send_message(withdraw_message)
+            del self.topics_subscribed[topic_name]
+            self.with_metadata.discard(topic_name)
+        else:
+            print(f'Error: Not subscribed to topic {topic_name}')
+
+    def stop(self):
+        if self.batching and self.connected:
+            self.flush(timeout=1)
+        self.connected = False
+        with self.batch_ready:
+            self.batch_ready.notify_all()
+        if self.callbacks is not None:
+            self.callbacks.stop()
+        try:
+            # Bez shutdown wątek czekający w recv trzyma gniazdo otwarte i serwer nie widzi rozłączenia
+            self.client_socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.client_socket.close()
+        self.topics_produced.clear()
+        self.topics_subscribed.clear()
+        self.with_metadata.clear()
+        print('Client stopped and disconnected from server')
+
+    def send_message(self, message):
+        if self.batching and self.connected:
+            # Komunikaty sterujące (register, withdraw, status) idą za czekającą paczką - inaczej
+            # np. withdraw wyprzedziłby wcześniejsze produce() i serwer odrzuciłby je jako nieznany temat
+            self.append_batch([encode_frame(message)], urgent=True)
+            return
+        with self.lock:
+            try:
+                self.client_socket.sendall(encode_frame(message))
+            except socket.error as e:
+                print(f'Error sending message: {e}')
+                self.connected = False
+
+    def send_raw(self, data):
+        with self.lock:
+            try:
+                self.client_socket.sendall(data)
+            except socket.error as e:
+                print(f'Error sending messages: {e}')
+                self.connected = False
+
+    def await_server_status_response(self, callback):
+        try:
+            while True:
+                data = self.client_socket.recv(RECV_SIZE)
+                if not data:
+                    break
+                for response in self.decoder.feed(data):
+                    response_message = json.loads(response)
+                    print("wszedłem do await_server_status_response")
+                    if response_message["type"] == "status" and response_message["topic"] == "logs":
+                        callback(response_message["payload"])
+                        return
+        except socket.error as e:
+            print(f'Error receiving message: {e}')
+
+    def listen_to_server(self):
+        try:
+            while self.connected:
+                data = self.client_socket.recv(RECV_SIZE)
+                if not data:
+                    break
+                for message in self.decoder.feed(data):
+                    self.handle_server_message(json.loads(message))
+        except ProtocolError as e:
+            print(f'Protocol error: {e}')
+        except socket.error as e:
+            print(f'Error receiving message from server: {e}')
+            self.connected = False
+        finally:
+            self.client_socket.close()
+            self.connected = False
+
+    def handle_server_message(self, message_data):
+        if message_data["type"] == "status" and message_data["topic"] == "logs":
+            status_callback(message_data["payload"])
+            # print(f'Received server status: {message_data["payload"]}')
+        else:
+            topic = message_data.get("topic")
+            callbacks = self.callbacks_for(topic)
+            if callbacks:
+                for callback, metadata in callbacks:
+                    args = callback_arguments(message_data, metadata)
+                    if self.callbacks is not None:
+                        self.callbacks.submit(topic, callback, *args)
+                    else:
+                        callback(*args)
+            else:
+                print(f'Received message on unregistered topic: {topic}')
+
+    def callbacks_for(self, topic):
+        if topic in self.topics_subscribed:
+            return [(self.topics_subscribed[topic], topic in self.with_metadata)]
+        # Komunikat dostarczony przez subskrypcję wzorca ('+', '#')
+        return [(callback, pattern in self.with_metadata) for pattern, callback in list(self.topics_subscribed.items())
+                if is_pattern(pattern) and matches(pattern, topic)]
+
+
+def status_callback(payload):
+    print(f'Callback Server status: {json.dumps(payload, indent=2)}')
+
+
+def message_callback(payload):
+    print(f'Callback Received message: {json.dumps(payload, indent=2)}')
+# Przykład użycia API z obsługą terminala
+if __name__ == "__main__":
+
+    client = SPClientAPI()
+    # client.start('127.0.0.1', 12345, 'Client1')
+
+    time.sleep(2)  # Czekaj na połączenie
+
+    while True:
+        time.sleep(1)
+        command = input(
+            "Enter command (start, stop, status, create_producer, produce, withdraw_producer, create_subscriber, withdraw_subscriber, server_status): ")
+
+        if command == "start":
+            if not client.is_connected():
+                # server_ip = input("Enter server IP: ")
+                # server_port = int(input("Enter server port: "))
+                server_ip = '127.0.0.1'
+                server_port = 12345
+                client_id = input("Enter client ID: ")
+                client.start(server_ip, server_port, client_id)
+            else:
+                print("Client already connected.")
+
+        elif command == "stop":
+            client.stop()
+            break
+
+        elif command == "status":
+            print(client.get_status())
+
+        elif command == "create_producer":
+            topic_name = input("Enter topic name: ")
+            client.create_producer(topic_name)
+
+        elif command == "produce":
+            topic_name = input("Enter topic name: ")
+            payload_content = input("Enter payload: ")
+            payload = {"content": payload_content}
+            client.produce(topic_name, payload)
+
+        elif command == "withdraw_producer":
+            topic_name = input("Enter topic name: ")
+            client.withdraw_producer(topic_name)
+
+        elif command == "create_subscriber":
+            topic_name = input("Enter topic name: ")
+            client.create_subscriber(topic_name, message_callback)
+
+        elif command == "withdraw_subscriber":
+            topic_name = input("Enter topic name: ")
+            client.withdraw_subscriber(topic_name)
+
+        elif command == "server_status":
+            client.get_server_status(status_callback)
+
+        elif command == "check_connection":
+            print(client.is_connected())
+
+        else:
+            print("Unknown command. Please try again.")
@@ -0,0 +1,173 @@
+import select
+import socket
+import threading
+from collections import deque
+from itertools import islice
+
+from protocol import FRAME_HEADER, FrameDecoder
+
+IOV_MAX = 1024  # Maksymalna liczba buforów w jednym sendmsg (writev)
+SEND_FLAGS = getattr(socket, 'MSG_DONTWAIT', 0)
+
+# Polityki dla subskrybentów, którzy nie nadążają z odbiorem
+DROP_OLDEST = 'drop-oldest'
+DROP_NEWEST = 'drop-newest'
+DISCONNECT = 'disconnect'
+BLOCK = 'block'
+POLICIES = (DROP_OLDEST, DROP_NEWEST, DISCONNECT, BLOCK)
+
+# Wynik Connection.enqueue
+QUEUED = 'queued'
+DROPPED = 'dropped'
+OVERFLOW = 'overflow'  # Polityka DISCONNECT - klienta trzeba rozłączyć
+CONGESTED = 'congested'  # Polityka BLOCK - producenta trzeba wstrzymać
+
+
+class Connection:
+    # Stan połączenia klienta: dekoder strumienia i ograniczona kolejka wyjściowa komunikatów.
+    # Komunikat w kolejce to krotka niezmiennych buforów (nagłówek, treść) współdzielonych między subskrybentami.
+    def __init__(self, client_socket, max_outbox=10000, policy=DROP_OLDEST):
+        self.socket = client_socket
+        self.decoder = FrameDecoder()
+        self.outbox = deque()
+        self.outbox_bytes = 0
+        self.max_outbox = max_outbox
+        self.policy = policy
+        self.dropped = 0
+        self.partial = False  # Czy pierwszy komunikat w kolejce został wysłany częściowo
+        self.scheduled = False  # Czy połączenie czeka już w KKW na opróżnienie
+        self.writable = False  # Czy pętla zdarzeń czeka na EVENT_WRITE (tryb selectors)
+        self.readable = threading.Event()  # Wyczyszczony = odczyt od klienta wstrzymany (backpressure)
+        self.readable.set()
+        self.blocked_producers = set()  # Producenci wstrzymani przez ten (wolny) subskrybent
+        self.blocked_by = set()  # Subskrybenci, na których czeka ten wstrzymany producent
+        self.replays = {}  # temat -> następny offset do odtworzenia z dziennika
+        self.held = deque()  # Komunikaty wstrzymanego producenta czekające na wznowienie (polityka block)
+        self.lock = threading.Lock()
+
+    @property
+    def legacy(self):
+        return self.decoder.legacy
+
+    @property
+    def paused(self):
+        return not self.readable.is_set()
+
+    def set_policy(self, policy=None, max_outbox=None):
+        # Najpierw sprawdzamy oba pola - błędny payload nie zmienia połowy ustawień
+        if policy is not None and policy not in POLICIES:
+            raise ValueError(f'Unsupported slow consumer policy: {policy}')
+        if max_outbox is not None:
+            try:
+                max_outbox = int(max_outbox)
+            except (TypeError, ValueError):
+                raise ValueError(f'Invalid max_outbox: {max_outbox!r}')
+            if max_outbox < 1:
+                raise ValueError(f'max_outbox must be a positive integer: {max_outbox}')
+            self.max_outbox = max_outbox
+        if policy is not None:
+            self.policy = policy
+
+    def enqueue(self, body, header=None):
+        if self.legacy:
+            message = (body,)
+        else:
+            message = (header if header is not None else FRAME_HEADER.pack(len(body)), body)
+        with self.lock:
+            if len(self.outbox) >= self.max_outbox:
+                if self.policy == DROP_NEWEST:
+                    self.dropped += 1
+                    return DROPPED
+                if self.policy == DISCONNECT:
+                    self.dropped += 1
+                    return OVERFLOW
+                if self.policy == DROP_OLDEST:
+                    self.drop_oldest()
+            self.append(message)
+            if self.policy == BLOCK and len(self.outbox) >= self.max_outbox:
+                return CONGESTED
+            return QUEUED
+
+    def enqueue_raw(self, data):
+        with self.lock:
+            self.append((data,))
+
+    def append(self, message):
+        self.outbox.append(message)
+        self.outbox_bytes += sum(len(buffer) for buffer in message)
+
+    def drop_oldest(self):
+        # Częściowo wysłanego komunikatu nie można usunąć bez zepsucia strumienia
+        index = 1 if self.partial else 0
+        if len(self.outbox) > index:
+            message = self.outbox[index]
+            del self.outbox[index]
+            self.outbox_bytes -= sum(len(buffer) for buffer in message)
+            self.dropped += 1
+
+    def below_low_watermark(self):
+        return len(self.outbox) <= self.max_outbox // 2
+
+    def flush(self):
+        # Wysyła ile się da bez blokowania; True gdy kolejka została opróżniona
+        with self.lock:
+            if self.socket.fileno() == -1:
+                self.outbox.clear()
+                self.outbox_bytes = 0
+                return True
+            while self.outbox:
+                buffers = [buffer for message in islice(self.outbox, IOV_MAX // 2) for buffer in message]
+                try:
+                    sent = send_buffers(self.socket, buffers)
+                except (BlockingIOError, InterruptedError):
+                    return False
+                self.consume(sent)
+                if sent < sum(len(buffer) for buffer in buffers):
+                    return False
+            return True
+
+    def consume(self, sent):
+        self.outbox_bytes -= sent
+        while sent:
+            message = self.outbox[0]
+            size = sum(len(buffer) for buffer in message)
+            if size <= sent:
+                sent -= size
+                self.outbox.popleft()
+                self.partial = False
+                continue
+            rest = []
+            for buffer in message:
+                if sent >= len(buffer):
+                    sent -= len(buffer)
+                else:
+                    rest.append(memoryview(buffer)[sent:])
+                    sent = 0
+            self.outbox[0] = tuple(rest)
+            self.partial = True
+
+    def stats(self):
+        return {
+            'outbox': len(self.outbox),
+            'outbox_bytes': self.outbox_bytes,
+            'max_outbox': self.max_outbox,
+            'policy': self.policy,
+            'dropped': self.dropped,
+            'paused': self.paused,
+        }
+
+
+def wait_readable(client_socket):
+    # False gdy gniazdo zostało w międzyczasie zamknięte przez inny wątek
+    try:
+        select.select([client_socket], [], [])
+    except (OSError, ValueError):
+        return False
+    return client_socket.fileno() != -1
+
+
+def send_buffers(client_socket, buffers):
+    if hasattr(client_socket, 'sendmsg'):
+        return client_socket.sendmsg(buffers, [], SEND_FLAGS)
+    # Windows nie ma sendmsg - sklejamy bufory w jeden zapis
+    return client_socket.send(b''.join(buffers))
@@ -0,0 +1,285 @@
+import queue
+import sys
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Granice kubełków histogramów czasu w sekundach (10 µs .. 10 s)
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+LEVELS = {'debug': DEBUG, 'info': INFO, 'warning': WARNING, 'error': ERROR}
+
+
+class Counter:
+    # Część liczników rośnie w kilku wątkach naraz (np. połączenia w trybie threaded) - += nie jest atomowe
+    __slots__ = ('value', 'lock')
+
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+
+class Gauge:
+    # Wartość ustawiana wprost albo liczona przy odczycie (function)
+    __slots__ = ('value', 'function')
+
+    def __init__(self, function=None):
+        self.value = 0
+        self.function = function
+
+    def set(self, value):
+        self.value = value
+
+    def get(self):
+        return self.function() if self.function is not None else self.value
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'count', 'sum')
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Ostatni kubełek to +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, fraction):
+        # Górna granica kubełka, w którym wypada kwantyl - dokładność zależy od podziału kubełków
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.buckets[index] if index < len(self.buckets) else float('inf')
+        return float('inf')
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'p50': self.quantile(0.5),
+            'p99': self.quantile(0.99),
+            'p999': self.quantile(0.999),
+        }
+
+
+class Metrics:
+    # Liczniki, wskaźniki i histogramy z etykietami, np. metrics.counter('messages_published_total', topic='a').inc().
+    # Liczniki mają własną blokadę. Histogramy aktualizuje tylko wątek obsługi komunikatów (pętla zdarzeń albo
+    # monitoring_thread), a wskaźniki klientów są odbudowywane przy odczycie.
+    def __init__(self):
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.collectors = []  # Funkcje uzupełniające metryki tuż przed odczytem
+        self.started = time.time()
+        self.last_snapshot = (time.monotonic(), {})
+
+    def counter(self, name, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        metric = self.counters.get(key)
+        if metric is None:
+            metric = self.counters.setdefault(key, Counter())
+        return metric
+
+    def gauge(self, name, function=None, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        metric = self.gauges.get(key)
+        if metric is None:
+            metric = self.gauges[key] = Gauge(function)
+        return metric
+
+    def histogram(self, name, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        metric = self.histograms.get(key)
+        if metric is None:
+            metric = self.histograms[key] = Histogram()
+        return metric
+
+    def drop(self, name):
+        # Usuwa wszystkie serie metryki (np. wskaźniki klientów odbudowywane przy każdym odczycie)
+        for metrics in (self.counters, self.gauges, self.histograms):
+            for key in [key for key in list(metrics) if key[0] == name]:
+                metrics.pop(key, None)
+
+    def drop_labels(self, **labels):
+        # Usuwa serie z podanymi etykietami (np. topic=... po usunięciu tematu), także z poprzedniego snapshot()
+        def matching(key):
+            return all(label in key[1] for label in labels.items())
+        for metrics in (self.counters, self.gauges, self.histograms):
+            for key in [key for key in list(metrics) if matching(key)]:
+                metrics.pop(key, None)
+        last_time, last_values = self.last_snapshot
+        self.last_snapshot = (last_time, {key: value for key, value in last_values.items() if not matching(key)})
+
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    def collect(self):
+        for collector in self.collectors:
+            collector()
+
+    def snapshot(self):
+        # Dla komunikatu status i konsoli: {nazwa: wartość} albo {nazwa: {"etykieta=wartość": wartość}}.
+        # Liczniki dostają też tempo (<nazwa>_per_second) liczone od poprzedniego snapshot().
+        self.collect()
+        now = time.monotonic()
+        last_time, last_values = self.last_snapshot
+        values = {}
+        result = {'uptime_seconds': round(time.time() - self.started, 1)}
+        for (name, labels), metric in list(self.counters.items()):
+            values[(name, labels)] = metric.value
+            rate = round((metric.value - last_values.get((name, labels), 0)) / max(now - last_time, 1e-9), 1)
+            put(result, name, labels, metric.value)
+            put(result, name.replace('_total', '') + '_per_second', labels, rate)
+        for (name, labels), metric in list(self.gauges.items()):
+            put(result, name, labels, metric.get())
+        for (name, labels), metric in list(self.histograms.items()):
+            put(result, name, labels, metric.snapshot())
+        self.last_snapshot = (now, values)
+        return result
+
+    def prometheus(self):
+        # Format tekstowy Prometheusa (text/plain; version=0.0.4)
+        self.collect()
+        lines = []
+        for metrics, kind in ((self.counters, 'counter'), (self.gauges, 'gauge')):
+            typed = set()
+            for (name, labels), metric in sorted(list(metrics.items()), key=lambda item: item[0][0]):
+                if name not in typed:
+                    lines.append(f'# TYPE {name} {kind}')
+                    typed.add(name)
+                value = metric.value if kind == 'counter' else metric.get()
+                lines.append(f'{name}{prometheus_labels(labels)} {value}')
+        typed = set()
+        for (name, labels), metric in sorted(list(self.histograms.items()), key=lambda item: item[0][0]):
+            if name not in typed:
+                lines.append(f'# TYPE {name} histogram')
+                typed.add(name)
+            cumulative = 0
+            for bound, count in zip(metric.buckets + ('+Inf',), list(metric.counts)):
+                cumulative += count
+                lines.append(f'{name}_bucket{prometheus_labels(labels + (("le", bound),))} {cumulative}')
+            lines.append(f'{name}_sum{prometheus_labels(labels)} {metric.sum}')
+            lines.append(f'{name}_count{prometheus_labels(labels)} {metric.count}')
+        return '\n'.join(lines) + '\n'
+
+
+def put(result, name, labels, value):
+    if labels:
+        result.setdefault(name, {})[','.join(f'{key}={label}' for key, label in labels)] = value
+    else:
+        result[name] = value
+
+
+def prometheus_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
+
+
+def serve_metrics(metrics, host, port):
+    # Lokalny endpoint GET /metrics w osobnym wątku
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != '/metrics':
+                self.send_error(404)
+                return
+            body = metrics.prometheus().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class Logger:
+    # Wpisy trafiają do kolejki, formatowanie i zapis robi osobny wątek - ścieżka komunikatu nie czeka na stdout.
+    # Komunikaty debug są próbkowane: z każdego szablonu wypisywany jest co sample_every-ty.
+    def __init__(self, level=INFO, sample_every=1, queue_size=10000, stream=None):
+        self.level = level
+        self.sample_every = sample_every
+        self.stream = stream
+        self.entries = queue.Queue(maxsize=queue_size)
+        self.samples = {}
+        self.dropped = 0
+        self.thread = None
+
+    def configure(self, level=None, sample_every=None):
+        if level is not None:
+            self.level = LEVELS[level.lower()] if isinstance(level, str) else level
+        if sample_every is not None:
+            self.sample_every = max(1, int(sample_every))
+
+    def debug(self, message, *args):
+        if self.level > DEBUG:
+            return
+        if self.sample_every > 1:
+            seen = self.samples.get(message, 0)
+            self.samples[message] = seen + 1
+            if seen % self.sample_every:
+                return
+        self.log(DEBUG, message, args)
+
+    def info(self, message, *args):
+        if self.level <= INFO:
+            self.log(INFO, message, args)
+
+    def warning(self, message, *args):
+        if self.level <= WARNING:
+            self.log(WARNING, message, args)
+
+    def error(self, message, *args):
+        self.log(ERROR, message, args)
+
+    def log(self, level, message, args):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.writer_thread, daemon=True)
+            self.thread.start()
+        try:
+            self.entries.put_nowait((message, args))
+        except queue.Full:
+            self.dropped += 1  # Wolniejszy stdout nie może zatrzymać serwera
+
+    def writer_thread(self):
+        while True:
+            message, args = self.entries.get()
+            lines = [message % args if args else message]
+            # Wszystko, co już czeka, jednym zapisem
+            while len(lines) < 1000:
+                try:
+                    message, args = self.entries.get_nowait()
+                except queue.Empty:
+                    break
+                lines.append(message % args if args else message)
+            if self.dropped:
+                lines.append(f'Log: dropped {self.dropped} entries')
+                self.dropped = 0
+            stream = self.stream or sys.stdout
+            stream.write('\n'.join(lines) + '\n')
+            stream.flush()
@@ -0,0 +1,149 @@
+import codecs
+import json
+import struct
+
+# Handshake wysyłany jako pierwszy przez klienta; serwer odpowiada tym samym z wersją, którą obsłuży.
+# Klienci bez handshake'u (np. producer.py) zaczynają od '{' i są traktowani jako legacy (surowy JSON).
+PROTOCOL_MAGIC = b'SPPS'
+PROTOCOL_VERSION = 1
+LEGACY_VERSION = 0
+
+FRAME_HEADER = struct.Struct('!I')  # 4 bajty długości, big-endian
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+RECV_SIZE = 256 * 1024
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def handshake(version=PROTOCOL_VERSION):
+    return PROTOCOL_MAGIC + bytes([version])
+
+
+def encode_body(message):
+    return json.dumps(message).encode()
+
+
+def encode_frame(message):
+    body = encode_body(message)
+    return FRAME_HEADER.pack(len(body)) + body
+
+
+class FrameDecoder:
+    # Przyrostowy dekoder strumienia: zwraca wszystkie kompletne komunikaty z bufora,
+    # resztę trzyma do następnego feed(). Wersja protokołu ustalana po pierwszych bajtach.
+    def __init__(self):
+        self.version = None
+        self.buffer = bytearray()
+        self.text = ''
+        self.text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self.scan = (0, 0, False, False)  # Stan szukania końca obiektu legacy: pozycja, głębokość, w napisie, escape
+
+    @property
+    def legacy(self):
+        return self.version == LEGACY_VERSION
+
+    def feed(self, data):
+        if self.version is None:
+            self.buffer += data
+            if not self.detect_version():
+                return []
+            data = bytes(self.buffer)
+            self.buffer.clear()
+        if self.legacy:
+            return self.feed_legacy(data)
+        return self.feed_framed(data)
+
+    def detect_version(self):
+        if not self.buffer:
+            return False
+        if self.buffer[:1] in (b'{', b' ', b'\n', b'\r', b'\t'):
+            self.version = LEGACY_VERSION
+            return True
+        if len(self.buffer) < len(PROTOCOL_MAGIC) + 1:
+            if not PROTOCOL_MAGIC.startswith(bytes(self.buffer[:len(PROTOCOL_MAGIC)])):
+                raise ProtocolError(f'Unknown protocol preamble: {bytes(self.buffer)!r}')
+            return False
+        if not self.buffer.startswith(PROTOCOL_MAGIC):
+            raise ProtocolError(f'Unknown protocol preamble: {bytes(self.buffer[:8])!r}')
+        self.version = self.buffer[len(PROTOCOL_MAGIC)]
+        if self.version == LEGACY_VERSION:
+            raise ProtocolError('Protocol version 0 is reserved for legacy clients')
+        del self.buffer[:len(PROTOCOL_MAGIC) + 1]
+        return True
+
+    def feed_framed(self, data):
+        self.buffer += data
+        bodies = []
+        view = memoryview(self.buffer)
+        offset = 0
+        try:
+            while len(view) - offset >= FRAME_HEADER.size:
+                (length,) = FRAME_HEADER.unpack_from(view, offset)
+                if length > MAX_FRAME_SIZE:
+                    raise ProtocolError(f'Frame of {length} bytes exceeds limit of {MAX_FRAME_SIZE}')
+                end = offset + FRAME_HEADER.size + length
+                if end > len(view):
+                    break
+                bodies.append(bytes(view[offset + FRAME_HEADER.size:end]))
+                offset = end
+        finally:
+            view.release()
+        del self.buffer[:offset]
+        return bodies
+
+    def feed_legacy(self, data):
+        # Legacy klienci wysyłają sklejone obiekty JSON bez ramek. Granicę obiektu wyznacza domykający nawias
+        # (poza napisami), więc podział TCP w środku literału, liczby czy escape'u nie psuje strumienia.
+        self.text += self.text_decoder.decode(data)
+        bodies = []
+        position = 0
+        while True:
+            while position < len(self.text) and self.text[position].isspace():
+                position += 1
+            if position == len(self.text):
+                break
+            if self.text[position] != '{':
+                # Niepoprawny komunikat - oddajemy go w całości, żeby błąd został zgłoszony przy json.loads
+                bodies.append(self.text[position:])
+                position = len(self.text)
+                break
+            end = self.object_end(position)
+            if end is None:
+                if len(self.text) - position > MAX_FRAME_SIZE:
+                    raise ProtocolError('Legacy message exceeds frame size limit')
+                break
+            # Obiekt niepoprawny w środku też jest oddawany - json.loads zgłosi błąd, następne komunikaty są całe
+            bodies.append(self.text[position:end])
+            position = end
+        self.text = self.text[position:]
+        return bodies
+
+    def object_end(self, start):
+        # Indeks za nawiasem domykającym obiekt zaczęty w start albo None, gdy brakuje jeszcze danych.
+        # Stan skanowania jest zapamiętany, żeby duży komunikat w wielu kawałkach nie był przeglądany od nowa.
+        scanned, depth, in_string, escape = self.scan
+        text = self.text
+        index = max(start, start + scanned)
+        while index < len(text):
+            char = text[index]
+            if in_string:
+                if escape:
+                    escape = False
+                elif char == '\\':
+                    escape = True
+                elif char == '"':
+                    in_string = False
+            elif char == '"':
+                in_string = True
+            elif char == '{' or char == '[':
+                depth += 1
+            elif char == '}' or char == ']':
+                depth -= 1
+                if depth == 0:
+                    self.scan = (0, 0, False, False)
+                    return index + 1
+            index += 1
+        self.scan = (index - start, depth, in_string, escape)
+        return None
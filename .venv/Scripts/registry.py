@@ -0,0 +1,187 @@
+TOPIC_SEPARATOR = '/'
+SINGLE_LEVEL = '+'  # Dokładnie jeden poziom nazwy tematu
+MULTI_LEVEL = '#'  # Wszystkie pozostałe poziomy (tylko na końcu wzorca)
+
+
+def is_pattern(topic):
+    return SINGLE_LEVEL in topic or MULTI_LEVEL in topic
+
+
+def validate_pattern(pattern):
+    levels = pattern.split(TOPIC_SEPARATOR)
+    for index, level in enumerate(levels):
+        if level == MULTI_LEVEL:
+            if index != len(levels) - 1:
+                raise ValueError(f"'{MULTI_LEVEL}' must be the last level of {pattern}")
+        elif level != SINGLE_LEVEL and is_pattern(level):
+            raise ValueError(f'Wildcard must occupy a whole level of {pattern}')
+    return levels
+
+
+def matches(pattern, topic):
+    # Pojedyncze dopasowanie bez drzewa - dla klientów z kilkoma wzorcami
+    levels = topic.split(TOPIC_SEPARATOR)
+    pattern_levels = pattern.split(TOPIC_SEPARATOR)
+    for index, level in enumerate(pattern_levels):
+        if level == MULTI_LEVEL:
+            return True
+        if index >= len(levels) or (level != SINGLE_LEVEL and level != levels[index]):
+            return False
+    return len(levels) == len(pattern_levels)
+
+
+class TrieNode:
+    __slots__ = ('children', 'subscribers')
+
+    def __init__(self):
+        self.children = {}
+        self.subscribers = {}  # client id -> socket
+
+
+class TopicTrie:
+    # Subskrypcje wzorców ('+', '#') ułożone po poziomach nazwy tematu;
+    # koszt dopasowania zależy od głębokości tematu, nie od liczby tematów
+    def __init__(self):
+        self.root = TrieNode()
+        self.patterns = {}  # wzorzec -> węzeł z jego subskrybentami
+
+    def add(self, pattern, client_id, client_socket):
+        node = self.root
+        for level in validate_pattern(pattern):
+            node = node.children.setdefault(level, TrieNode())
+        node.subscribers[client_id] = client_socket
+        self.patterns[pattern] = node
+
+    def remove(self, pattern, client_id):
+        node = self.patterns.get(pattern)
+        if node is None or client_id not in node.subscribers:
+            return False
+        del node.subscribers[client_id]
+        if not node.subscribers:
+            del self.patterns[pattern]
+            self.prune(pattern.split(TOPIC_SEPARATOR))
+        return True
+
+    def prune(self, levels):
+        path = [self.root]
+        for level in levels:
+            path.append(path[-1].children[level])
+        for level, parent, node in zip(reversed(levels), reversed(path[:-1]), reversed(path[1:])):
+            if node.children or node.subscribers:
+                break
+            del parent.children[level]
+
+    def match(self, topic):
+        levels = topic.split(TOPIC_SEPARATOR)
+        matched = {}
+        stack = [(self.root, 0)]
+        while stack:
+            node, depth = stack.pop()
+            multi = node.children.get(MULTI_LEVEL)
+            if multi is not None:
+                matched.update(multi.subscribers)
+            if depth == len(levels):
+                matched.update(node.subscribers)
+                continue
+            for level in (levels[depth], SINGLE_LEVEL):
+                child = node.children.get(level)
+                if child is not None:
+                    stack.append((child, depth + 1))
+        return matched
+
+
+class Registry:
+    # Tablice routingu serwera z indeksami odwrotnymi: gniazdo -> id klienta -> tematy,
+    # więc rozłączenie i wycofanie kosztują tyle, ile tematów dotyka klient
+    def __init__(self):
+        self.topics = {}  # temat -> {'producers': {id: gniazdo}, 'subscribers': {id: gniazdo}}
+        self.clients = {}  # gniazdo -> id klienta
+        self.memberships = {}  # gniazdo -> {'produced': set(tematy), 'subscribed': set(tematy i wzorce)}
+        self.wildcards = TopicTrie()
+
+    def add_client(self, client_socket, client_id='new user'):
+        self.clients.setdefault(client_socket, client_id)
+        return self.membership(client_socket)
+
+    def membership(self, client_socket):
+        membership = self.memberships.get(client_socket)
+        if membership is None:
+            membership = self.memberships[client_socket] = {'produced': set(), 'subscribed': set()}
+        return membership
+
+    def add_producer(self, topic, client_id, client_socket):
+        if is_pattern(topic):
+            raise ValueError(f'Topic {topic} can not contain wildcards')
+        if topic in self.topics:
+            return False
+        self.topics[topic] = {'producers': {client_id: client_socket}, 'subscribers': {}}
+        self.clients[client_socket] = client_id
+        self.membership(client_socket)['produced'].add(topic)
+        return True
+
+    def add_subscriber(self, topic, client_id, client_socket):
+        if is_pattern(topic):
+            self.wildcards.add(topic, client_id, client_socket)
+        elif topic in self.topics:
+            self.topics[topic]['subscribers'][client_id] = client_socket
+        else:
+            return False
+        self.clients[client_socket] = client_id
+        self.membership(client_socket)['subscribed'].add(topic)
+        return True
+
+    def is_producer(self, topic, client_id, client_socket):
+        return topic in self.topics and self.topics[topic]['producers'].get(client_id) is client_socket
+
+    def remove_subscriber(self, topic, client_id, client_socket):
+        if is_pattern(topic):
+            removed = self.wildcards.remove(topic, client_id)
+        elif topic in self.topics and client_id in self.topics[topic]['subscribers']:
+            del self.topics[topic]['subscribers'][client_id]
+            removed = True
+        else:
+            removed = False
+        if removed and client_socket in self.memberships:
+            self.memberships[client_socket]['subscribed'].discard(topic)
+        return removed
+
+    def remove_topic(self, topic):
+        # Zwraca subskrybentów usuniętego tematu - do sprawdzenia, czy mają jeszcze po co być połączeni
+        data = self.topics.pop(topic)
+        for client_socket in data['producers'].values():
+            if client_socket in self.memberships:
+                self.memberships[client_socket]['produced'].discard(topic)
+        for client_socket in data['subscribers'].values():
+            if client_socket in self.memberships:
+                self.memberships[client_socket]['subscribed'].discard(topic)
+        return data['subscribers']
+
+    def remove_client(self, client_socket):
+        client_id = self.clients.pop(client_socket, None)
+        membership = self.memberships.pop(client_socket, None)
+        orphans = {}
+        if membership is None:
+            return orphans
+        for topic in membership['subscribed']:
+            if is_pattern(topic):
+                self.wildcards.remove(topic, client_id)
+            elif topic in self.topics:
+                self.topics[topic]['subscribers'].pop(client_id, None)
+        for topic in membership['produced']:
+            if topic in self.topics:
+                orphans.update(self.remove_topic(topic))
+        return orphans
+
+    def is_idle(self, client_socket):
+        membership = self.memberships.get(client_socket)
+        return membership is None or not (membership['produced'] or membership['subscribed'])
+
+    def subscribers_of(self, topic):
+        data = self.topics.get(topic)
+        subscribers = dict(data['subscribers']) if data else {}
+        if self.wildcards.patterns:
+            subscribers.update(self.wildcards.match(topic))
+        return subscribers
+
+    def wildcard_subscriptions(self):
+        return {pattern: list(node.subscribers) for pattern, node in self.wildcards.patterns.items()}
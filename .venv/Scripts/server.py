@@ -0,0 +1,1367 @@
+import socket
+import selectors
+import json
+import multiprocessing
+import multiprocessing.connection
+import os
+import queue
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime
+
+from connection import BLOCK, CONGESTED, DROP_OLDEST, OVERFLOW, Connection, wait_readable
+from protocol import FRAME_HEADER, FrameDecoder, ProtocolError, PROTOCOL_VERSION, RECV_SIZE, encode_body, handshake
+from registry import Registry, is_pattern
+from topic_log import LogStore
+from metrics import Logger, Metrics, serve_metrics
+from shard import (DELIVER, DISCONNECT, DISPATCH, ORPHAN, PAUSE, PEER_RETRY_MAX, PEER_RETRY_MIN, RESUME, STATUS,
+                   STATUS_REPLY, RemoteClient, merge_status, shard_for, socket_path)
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Dane do przechowywania stanu serwera
+registry = Registry()  # Tematy, klienci i subskrypcje z indeksami odwrotnymi
+KKO = queue.Queue(maxsize=10000)  # Kolejka komunikatów odebranych, pełna kolejka wstrzymuje odczyt od klientów
+KKW = queue.Queue()  # Kolejka połączeń do opróżnienia; każde połączenie jest w niej najwyżej raz
+metrics = Metrics()  # Liczniki, wskaźniki i histogramy - status, 'show stats' i opcjonalny endpoint HTTP
+log = Logger()  # Asynchroniczny log zamiast print na ścieżce komunikatu
+MESSAGE_TYPES = ('register', 'withdraw', 'message', 'status')
+WORKER_RESTART_DELAY = 1.0  # Sekundy między ponownymi uruchomieniami workera, który od razu się kończy
+
+
+class Server:
+    def __init__(self, server_id, host, port, backlog=5, queue_size=10000, max_outbox=10000, policy=DROP_OLDEST,
+                 log_store=None, metrics_port=None):
+        self.server_id = server_id
+        self.host = host
+        self.port = port
+        self.max_outbox = max_outbox
+        self.policy = policy
+        self.log_store = log_store  # Opcjonalny trwały dziennik komunikatów (topic_log.LogStore)
+        KKO.maxsize = queue_size
+        self.server_socket = self.create_server_socket()
+        self.server_socket.bind((self.host, self.port))
+        self.server_socket.listen(backlog)
+        self.connections = {}  # Stan połączenia (dekoder, kolejka wyjściowa) dla każdego gniazda
+        self.state_lock = threading.RLock()  # Handlery i rozłączenia z różnych wątków w trybie threaded
+        self.write_selector = None  # Tryb threaded: gniazda z pełnym buforem czekające na możliwość zapisu
+        self.write_lock = threading.Lock()
+        self.register_metrics()
+        if metrics_port:
+            serve_metrics(metrics, self.host, metrics_port)
+            print(f'Serwer {self.server_id}: metrics on http://{self.host}:{metrics_port}/metrics')
+        print(f'Serwer {self.server_id} opened on {self.host}:{self.port}')
+
+    def register_metrics(self):
+        metrics.gauge('kko_depth', KKO.qsize)
+        metrics.gauge('kko_limit', lambda: KKO.maxsize)
+        metrics.gauge('kkw_depth', KKW.qsize)
+        metrics.gauge('connections', lambda: len(self.connections))
+        metrics.gauge('topics', lambda: len(registry.topics))
+        metrics.gauge('wildcard_patterns', lambda: len(registry.wildcards.patterns))
+        metrics.add_collector(self.collect_client_metrics)
+
+    def collect_client_metrics(self):
+        # Opóźnienie per klient: komunikaty czekające w kolejce wyjściowej i zaległości odtwarzania z dziennika
+        for name in ('client_outbox_messages', 'client_outbox_bytes', 'client_dropped', 'client_replay_lag'):
+            metrics.drop(name)
+        for client_socket, connection in list(self.connections.items()):
+            client = str(registry.clients.get(client_socket))
+            metrics.gauge('client_outbox_messages', client=client).set(len(connection.outbox))
+            metrics.gauge('client_outbox_bytes', client=client).set(connection.outbox_bytes)
+            metrics.gauge('client_dropped', client=client).set(connection.dropped)
+            if connection.replays and self.log_store is not None:
+                lag = sum(self.log_store.next_offset(topic) - offset for topic, offset in list(connection.replays.items()))
+                metrics.gauge('client_replay_lag', client=client).set(lag)
+
+    def create_server_socket(self):
+        return socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+
+    def start(self):
+        self.write_selector = selectors.DefaultSelector()
+        threading.Thread(target=self.communication_thread).start()
+        threading.Thread(target=self.monitoring_thread).start()
+        threading.Thread(target=self.writable_thread, daemon=True).start()
+        threading.Thread(target=self.user_interface_thread).start()
+
+    def communication_thread(self):
+        while True:
+            try:
+                client_socket, addr = self.server_socket.accept()
+                # Nieblokujące także tutaj - bez MSG_DONTWAIT (Windows) send() z monitoring_thread
+                # czekałby na wolnego subskrybenta i wstrzymał dostarczanie wszystkim
+                client_socket.setblocking(False)
+                registry.add_client(client_socket)
+                self.connections[client_socket] = self.create_connection(client_socket)
+                threading.Thread(target=self.client_handler, args=(client_socket,)).start()
+            except socket.error as e:
+                log.error('Błąd gniazda: %s', e)
+
+    def create_connection(self, client_socket):
+        metrics.counter('connections_accepted_total').inc()
+        return Connection(client_socket, self.max_outbox, self.policy)
+
+    def client_handler(self, client_socket):
+        connection = self.connections[client_socket]
+        try:
+            while True:
+                connection.readable.wait()
+                try:
+                    data = client_socket.recv(RECV_SIZE)
+                except (BlockingIOError, InterruptedError):
+                    if not wait_readable(client_socket):
+                        break
+                    continue
+                if not data:
+                    break
+                for message in self.decode_messages(client_socket, data):
+                    # Blokuje, gdy KKO jest pełna - producent przestaje być czytany
+                    KKO.put({
+                        'socket': client_socket,
+                        'message': message
+                    })
+        except ProtocolError as e:
+            log.warning('Client handler: Protocol error: %s', e)
+        except socket.error as e:
+            log.warning('Client handler: Socket error: %s', client_socket)
+        finally:
+            self.disconnect_client(client_socket)
+
+    def decode_messages(self, client_socket, data):
+        decoder = self.connections[client_socket].decoder
+        detecting = decoder.version is None
+        messages = decoder.feed(data)
+        if detecting and decoder.version is not None and not decoder.legacy:
+            self.send_handshake(client_socket, min(decoder.version, PROTOCOL_VERSION))
+        return messages
+
+    def send_handshake(self, client_socket, version):
+        connection = self.connections.get(client_socket)
+        if connection:
+            connection.enqueue_raw(handshake(version))
+            self.schedule_flush(connection)
+
+    def send_message(self, client_socket, message):
+        self.deliver(client_socket, encode_body(message))
+
+    def deliver(self, client_socket, body, header=None, producer_socket=None):
+        # body to gotowy, współdzielony bufor bajtów - trafia do kolejki wyjściowej subskrybenta bez kopiowania
+        connection = self.connections.get(client_socket)
+        if connection is None:
+            return
+        result = connection.enqueue(body, header)
+        if result == OVERFLOW:
+            metrics.counter('slow_consumer_disconnects_total').inc()
+            log.warning('KKW: Subscriber %s is too slow, disconnecting', registry.clients.get(client_socket))
+            self.disconnect_client(client_socket)
+            return
+        if result == CONGESTED:
+            self.congested(producer_socket, connection)
+        self.schedule_flush(connection)
+
+    def deliver_many(self, subscriber_sockets, body, header, producer_socket=None):
+        for subscriber_socket in subscriber_sockets:
+            self.deliver(subscriber_socket, body, header, producer_socket)
+
+    def schedule_flush(self, connection):
+        if not connection.scheduled:
+            connection.scheduled = True
+            KKW.put(connection)
+
+    def congested(self, producer_socket, subscriber):
+        if producer_socket in self.connections:
+            self.block_producer(self.connections[producer_socket], subscriber)
+
+    def block_producer(self, producer, subscriber):
+        subscriber.blocked_producers.add(producer)
+        producer.blocked_by.add(subscriber)
+        if not producer.paused:
+            metrics.counter('producer_pauses_total').inc()
+            log.debug('Backpressure: Pausing %s', registry.clients.get(producer.socket))
+            self.pause_reading(producer)
+
+    def release_producers(self, subscriber, force=False):
+        if not subscriber.blocked_producers or not (force or subscriber.below_low_watermark()):
+            return
+        # W trybie threaded wywoływane z monitoring_thread i z wątków rozłączających klientów
+        with self.state_lock:
+            producers = subscriber.blocked_producers
+            subscriber.blocked_producers = set()
+            for producer in producers:
+                self.unblock_producer(producer, subscriber)
+
+    def unblock_producer(self, producer, blocker):
+        producer.blocked_by.discard(blocker)
+        if producer.blocked_by:
+            return  # Producent czeka jeszcze na innego wolnego subskrybenta
+        if producer.socket in self.connections:
+            log.debug('Backpressure: Resuming %s', registry.clients.get(producer.socket))
+            self.resume_reading(producer)
+            self.dispatch_held(producer)
+
+    def pause_reading(self, connection):
+        connection.readable.clear()
+
+    def resume_reading(self, connection):
+        connection.readable.set()
+
+    def accept_message(self, message, client_socket):
+        # Komunikaty wstrzymanego producenta odebrane przed pauzą (KKO, reszta odczytu) czekają przy nim,
+        # żeby polityka block nie przepełniała kolejki wyjściowej subskrybenta ponad max_outbox
+        connection = self.connections.get(client_socket)
+        if connection is not None and (connection.paused or connection.held):
+            connection.held.append(message)
+            return
+        self.handle_message(message, client_socket)
+
+    def dispatch_held(self, producer):
+        while producer.held and not producer.paused and producer.socket in self.connections:
+            self.handle_message(producer.held.popleft(), producer.socket)
+
+    def handle_message(self, message, client_socket):
+        try:
+            message_data = json.loads(message)
+            if not self.validate_message(message_data):
+                return
+            started = time.perf_counter()
+            with self.state_lock:
+                self.dispatch(message_data, client_socket)
+            if message_data['type'] in MESSAGE_TYPES:
+                metrics.histogram('dispatch_seconds', type=message_data['type']).observe(time.perf_counter() - started)
+        except json.JSONDecodeError as e:
+            metrics.counter('invalid_messages_total').inc()
+            log.warning('Błąd dekodowania komunikatu JSON: %s', e)
+        except KeyError as e:
+            metrics.counter('invalid_messages_total').inc()
+            log.warning('Validate: no such element in message %s', e)
+
+    def dispatch(self, message_data, client_socket):
+        if message_data['type'] == 'register':
+            self.handle_register(message_data, client_socket)
+        elif message_data['type'] == 'withdraw':
+            self.handle_withdraw(message_data, client_socket)
+        elif message_data['type'] == 'message':
+            self.handle_message_type(message_data, client_socket)
+        elif message_data['type'] == 'status':
+            self.handle_status(message_data, client_socket)
+        else:
+            log.warning('Nieobsługiwany typ komunikatu: %s', message_data["type"])
+
+    def handle_register(self, message_data, client_socket):
+        topic = message_data['topic']
+        client_id = message_data['id']
+        mode = message_data['mode']
+
+        if mode == 'producer':
+            try:
+                registered = registry.add_producer(topic, client_id, client_socket)
+            except ValueError as e:
+                log.warning('Register: %s', e)
+                return
+            if registered:
+                log.info('Register: Registered producer %s for topic %s', client_id, topic)
+            else:
+                log.warning('Register: Topic %s is already exist', topic)
+                # self.send_response(client_socket, 'rejected', 'Temat już istnieje')
+        elif mode == 'subscriber':
+            try:
+                registered = registry.add_subscriber(topic, client_id, client_socket)
+            except ValueError as e:
+                log.warning('Register: %s', e)
+                return
+            if registered:
+                self.apply_subscriber_policy(message_data, client_socket)
+                log.info('Register: Registered subscriber for %s', topic)
+                self.start_replay(message_data, client_socket)
+            else:
+                log.warning('Register: Topic %s does not exist', topic)
+        else:
+            log.warning('Register: unsupported mode %s', mode)
+
+    def apply_subscriber_policy(self, message_data, client_socket):
+        payload = message_data['payload']
+        connection = self.connections.get(client_socket)
+        if not isinstance(payload, dict) or connection is None:
+            return
+        try:
+            connection.set_policy(payload.get('policy'), payload.get('max_outbox'))
+        except ValueError as e:
+            log.warning('Register: %s', e)
+
+    def start_replay(self, message_data, client_socket):
+        # payload {'offset': N} albo {'since': ISO 8601} - najpierw zaległości z dziennika, potem na żywo
+        payload = message_data['payload']
+        topic = message_data['topic']
+        if self.log_store is None or not isinstance(payload, dict) or is_pattern(topic):
+            return
+        try:
+            if 'offset' in payload:
+                offset = int(payload['offset'])
+            elif 'since' in payload:
+                offset = self.log_store.offset_for_time(topic, datetime.fromisoformat(payload['since']).timestamp())
+            else:
+                return
+        except (TypeError, ValueError) as e:
+            log.warning('Register: Invalid replay position: %s', e)
+            return
+        self.replay_from(client_socket, topic, offset)
+
+    def replay_from(self, client_socket, topic, offset):
+        connection = self.connections.get(client_socket)
+        if connection is not None:
+            connection.replays[topic] = offset
+            self.pump_replay(connection)
+
+    def pump_replay(self, connection):
+        # Dokłada kolejną porcję z dziennika, gdy kolejka wyjściowa subskrybenta się opróżnia
+        while connection.replays and connection.below_low_watermark():
+            topic, offset = next(iter(connection.replays.items()))
+            budget = max(1, connection.max_outbox // 2 - len(connection.outbox))
+            records = self.log_store.read(topic, offset, budget)
+            for offset, body in records:
+                connection.enqueue(body)
+            if len(records) < budget:
+                del connection.replays[topic]  # Dogonił dziennik - dalej dostaje komunikaty na żywo
+            else:
+                connection.replays[topic] = offset + 1
+            self.schedule_flush(connection)
+
+    def replaying(self, client_socket, topic):
+        connection = self.connections.get(client_socket)
+        return connection is not None and topic in connection.replays
+
+    def stop_replay(self, client_socket, topic):
+        connection = self.connections.get(client_socket)
+        if connection is not None:
+            connection.replays.pop(topic, None)
+
+    def topic_removed(self, topic, subscribers):
+        # Usunięty temat nie ma już czego odtwarzać swoim subskrybentom ani serii w metrykach
+        for subscriber_socket in subscribers.values():
+            self.stop_replay(subscriber_socket, topic)
+        metrics.drop_labels(topic=topic)
+
+    def remove_client(self, client_socket):
+        # Razem z klientem znikają produkowane przez niego tematy
+        membership = registry.memberships.get(client_socket)
+        removed = {topic: dict(registry.topics[topic]['subscribers'])
+                   for topic in (membership['produced'] if membership else ()) if topic in registry.topics}
+        subs_to_delete = registry.remove_client(client_socket)
+        for topic, subscribers in removed.items():
+            self.topic_removed(topic, subscribers)
+        return subs_to_delete
+
+    def handle_withdraw(self, message_data, client_socket):
+        topic = message_data['topic']
+        client_id = message_data['id']
+        mode = message_data['mode']
+
+        if mode == 'producer':
+            if registry.is_producer(topic, client_id, client_socket):
+                subs_to_delete = registry.remove_topic(topic)
+                self.topic_removed(topic, subs_to_delete)
+                subs_to_delete.pop(client_id, None)
+                log.info('subskrybenci tematu: %s', list(subs_to_delete))
+                self.check_users_to_delete(subs_to_delete)
+                log.info('Withdraw: Deleted %s', topic)
+            elif topic not in registry.topics:
+                log.warning('Withdraw: Topic %s does not exist', topic)
+            else:
+                log.warning('Withdraw: %s is not a producer of %s', client_id, topic)
+        elif mode == 'subscriber':
+            if registry.remove_subscriber(topic, client_id, client_socket):
+                self.stop_replay(client_socket, topic)
+                log.info('Withdraw: Deleted subscriber of %s', topic)
+            elif not is_pattern(topic) and topic not in registry.topics:
+                log.warning('Withdraw: Topic %s does not exist', topic)
+            else:
+                log.warning('Withdraw: Client %s is not a subscriber of %s', client_id, topic)
+        else:
+            log.warning('Withdraw: No supported type %s', mode)
+
+    def handle_message_type(self, message_data, client_socket):
+        topic = message_data['topic']
+        if topic in registry.topics:
+            subscribers = registry.subscribers_of(topic)
+            if self.log_store is not None:
+                # Komunikat trafia do dziennika także bez subskrybentów; offset pozwala wznowić odbiór
+                message_data['offset'] = self.log_store.next_offset(topic)
+                body = encode_body(message_data)
+                self.log_store.append(topic, body)
+                # Subskrybenci w trakcie odtwarzania dostaną ten komunikat z dziennika
+                subscribers = {id: sock for id, sock in subscribers.items() if not self.replaying(sock, topic)}
+            elif subscribers:
+                body = encode_body(message_data)
+            metrics.counter('messages_published_total', topic=topic).inc()
+            if subscribers:
+                # Serializacja raz na komunikat, nie raz na subskrybenta
+                header = FRAME_HEADER.pack(len(body))
+                self.deliver_many(subscribers.values(), body, header, client_socket)
+                metrics.counter('messages_delivered_total', topic=topic).inc(len(subscribers))
+                metrics.counter('bytes_delivered_total', topic=topic).inc(len(subscribers) * len(body))
+                log.debug('KKW: Added new message to %s for %d subscriber(s)', topic, len(subscribers))
+            else:
+                log.debug('Topics: No subscribers of topic: %s', topic)
+        else:
+            metrics.counter('messages_unroutable_total').inc()
+            log.debug('Topics: Topic %s does not exist', topic)
+
+    def handle_status(self, message_data, client_socket):
+        log.debug('Status: %s', message_data)
+        status_message = self.status_payload()
+        self.send_status(client_socket, status_message)
+
+    def status_payload(self):
+        status_message = {
+            "registered_topics": {},
+        }
+        for topic, data in registry.topics.items():
+            status_message["registered_topics"][topic] = {
+                "producers": list(data["producers"].keys()) if data["producers"] else ["brak"],
+                # "subscribers": len(data["subscribers"]) if data["subscribers"] else ["brak"],
+                "subscribers": list(data["subscribers"].keys()) if data["subscribers"] else ["brak"],
+
+            }
+        status_message["wildcard_subscriptions"] = registry.wildcard_subscriptions()
+        status_message["queues"] = self.queue_stats()
+        if self.log_store is not None:
+            status_message["log"] = self.log_store.stats()
+        status_message["metrics"] = metrics.snapshot()
+        return status_message
+
+    def send_status(self, client_socket, status_message):
+        self.send_message(client_socket, {
+            'type': 'status',
+            'id': registry.clients[client_socket],
+            'topic': 'logs',
+            'mode': '',
+            'timestamp': datetime.now().isoformat(),
+            'payload': status_message
+        })
+        log.debug('KKW: Added new message for %s', registry.clients[client_socket])
+
+    def queue_stats(self):
+        return {
+            "KKO": {"depth": KKO.qsize(), "limit": KKO.maxsize},
+            "KKW": {"depth": KKW.qsize()},
+            "clients": {
+                str(registry.clients.get(client_socket)): connection.stats()
+                for client_socket, connection in list(self.connections.items())
+            },
+        }
+
+    def send_response(self, client_socket, response_type, message):
+        self.send_message(client_socket, message)
+
+    def disconnect_client(self, client_socket):
+        with self.state_lock:
+            subs_to_delete = self.remove_client(client_socket)
+            self.check_users_to_delete(subs_to_delete)
+            self.close_client_socket(client_socket)
+
+    def close_client_socket(self, client_socket):
+        connection = self.connections.pop(client_socket, None)
+        if connection is not None:
+            metrics.counter('connections_closed_total').inc()
+            connection.readable.set()
+            self.release_producers(connection, force=True)
+        try:
+            # shutdown budzi wątek czekający w recv na tym gnieździe i wysyła FIN do klienta
+            client_socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.unwatch_writable(client_socket)
+        client_socket.close()
+
+    def check_users_to_delete(self, subs_to_delete):
+        # Subskrybent bez żadnego tematu i wzorca zostaje rozłączony
+        for id, sock in subs_to_delete.items():
+            if registry.is_idle(sock):
+                log.info('Disconnecting: %s, %s', id, sock)
+                self.disconnect_idle(sock)
+
+    def disconnect_idle(self, client_socket):
+        connection = self.connections.get(client_socket)
+        if connection is not None:
+            try:
+                connection.flush()  # Bez blokowania: ostatnie komunikaty tematu, zanim gniazdo zostanie zamknięte
+            except socket.error:
+                pass
+        self.disconnect_client(client_socket)
+
+    def maintain_log(self):
+        # fsync zbiorczy i retencja dziennika - także gdy do tematów nic nie przychodzi
+        if self.log_store is None:
+            return
+        if self.log_store.sync_due():
+            self.log_store.sync()
+        if self.log_store.retention_due():
+            self.log_store.enforce_retention()
+
+    def monitoring_thread(self):
+        while True:
+            # Bez czekających zapisów wątek śpi na KKO zamiast odpytywać kolejki
+            timeout = 0.1
+            if self.log_store is not None and self.log_store.timeout() is not None:
+                timeout = min(timeout, self.log_store.timeout())
+            try:
+                message = KKO.get(timeout=0 if KKW.qsize() else timeout)
+            except queue.Empty:
+                message = None
+            if message is not None:
+                log.debug('KKO: Message taken: %s', message)
+                try:
+                    self.accept_message(message['message'], message['socket'])
+                except Exception:
+                    self.handler_failed(message['socket'])
+            self.maintain_log()
+
+            for _ in range(KKW.qsize()):
+                # Cała kolejka połączenia idzie jednym sendmsg
+                connection = KKW.get_nowait()
+                try:
+                    self.flush_pending(connection)
+                except Exception:
+                    self.handler_failed(connection.socket)
+
+    def handler_failed(self, client_socket):
+        # Nieoczekiwany błąd w obsłudze jednego klienta nie może zatrzymać pętli zdarzeń ani monitoring_thread -
+        # rozłączany jest tylko ten klient
+        metrics.counter('handler_errors_total').inc()
+        log.error('Handler: Unexpected error for %s: %s', registry.clients.get(client_socket), traceback.format_exc())
+        if client_socket in self.connections:
+            try:
+                self.disconnect_client(client_socket)
+            except Exception:
+                log.error('Handler: Error while disconnecting: %s', traceback.format_exc())
+
+    def flush_pending(self, connection):
+        connection.scheduled = False
+        try:
+            flushed = connection.flush()
+        except socket.error as e:
+            log.warning('KKW: Error while message sending: %s', e)
+            flushed = True
+        if not flushed:
+            # Wolny subskrybent nie wraca od razu do KKW - czeka, aż gniazdo znów przyjmie dane
+            self.watch_writable(connection)
+        self.release_producers(connection)
+        if connection.replays:
+            self.pump_replay(connection)
+
+    def watch_writable(self, connection):
+        with self.write_lock:
+            try:
+                self.write_selector.register(connection.socket, selectors.EVENT_WRITE, connection)
+            except (KeyError, ValueError):
+                pass  # Już obserwowane albo gniazdo zamknięte w międzyczasie
+
+    def unwatch_writable(self, client_socket):
+        if self.write_selector is None:
+            return
+        with self.write_lock:
+            try:
+                self.write_selector.unregister(client_socket)
+            except (KeyError, ValueError):
+                pass
+
+    def writable_thread(self):
+        # Gniazdo znów przyjmuje dane -> połączenie wraca do KKW, a pusty wpis w KKO budzi monitoring_thread
+        while True:
+            for key, _ in self.write_selector.select(timeout=1.0):
+                self.unwatch_writable(key.fileobj)
+                self.schedule_flush(key.data)
+                try:
+                    KKO.put_nowait(None)
+                except queue.Full:
+                    pass  # monitoring_thread i tak nie śpi przy pełnej KKO
+
+    def validate_message(self, message_data):
+        try:
+            # Dodaj walidację formatu komunikatu
+            required_fields = ['type', 'id', 'topic', 'mode', 'timestamp', 'payload']
+            for field in required_fields:
+                if field not in message_data:
+                    log.warning('Validate: Incorrect message format: %s', field)
+                    return False
+            # Rejestr i drzewo wzorców dzielą temat na poziomy - temat i identyfikator muszą być tekstem
+            for field in ('id', 'topic'):
+                if not isinstance(message_data[field], str):
+                    log.warning('Validate: %s must be a string', field)
+                    return False
+
+            return True
+        except Exception as e:
+            log.warning('ValidateError: %s', e)
+            return False
+
+    def manage_message(self, message):
+        print(message)
+        message_data = message['message']
+        message_type = message_data['type']
+        if message_type == 'register':
+            self.handle_register(message_data, message['socket'])
+        elif message_type == 'withdraw':
+            self.handle_withdraw(message_data, message['socket'])
+        elif message_type == 'message':
+            self.handle_message_type(message_data, message['socket'])
+        elif message_type == 'status':
+            self.handle_status(message_data, message['socket'])
+        else:
+            print(f'MessageManager: unsupported message type: {message_type}')
+
+    def user_interface_thread(self):
+        while True:
+            time.sleep(3)
+            command = input("Write command (np. 'show topics', 'show clients', 'show stats'): ")
+            if command.lower() == 'show topics':
+                self.show_registered_topics()
+            if command.lower() == 'show clients':
+                self.show_connected_clients()
+            if command.lower() == 'show stats':
+                self.show_stats()
+            ## zamykanie serwera
+
+    def show_registered_topics(self):
+        print("Registered topics:")
+        if not registry.topics:
+            print("No topics to show.")
+            return
+        for topic, data in registry.topics.items():
+            producers = list(data['producers'].keys())
+            if len(data['subscribers']):
+                subscribers = list(data['subscribers'])
+            else:
+                subscribers = 0
+            print(f"Temat: {topic}, Producent(ów): {producers}, Subskrybentów: {subscribers}")
+        for pattern, subscribers in registry.wildcard_subscriptions().items():
+            print(f"Wzorzec: {pattern}, Subskrybentów: {subscribers}")
+
+    def show_connected_clients(self):
+        print("Connected clients:")
+        for client, data in list(registry.clients.items()):
+            print(f'{data}: {client}')
+
+    def show_stats(self):
+        print("Server stats:")
+        for name, value in metrics.snapshot().items():
+            if isinstance(value, dict):
+                print(f'{name}:')
+                for labels, labelled in value.items():
+                    print(f'    {labels}: {labelled}')
+            else:
+                print(f'{name}: {value}')
+
+
+class SelectorServer(Server):
+    # Jedna nieblokująca pętla zdarzeń zamiast wątku na klienta i odpytywania KKO/KKW
+    def __init__(self, server_id, host, port, backlog=socket.SOMAXCONN, **options):
+        raise_fd_limit()
+        super().__init__(server_id, host, port, backlog, **options)
+        self.server_socket.setblocking(False)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.server_socket, selectors.EVENT_READ, self.accept_client)
+
+    def start(self):
+        threading.Thread(target=self.user_interface_thread, daemon=True).start()
+        self.event_loop()
+
+    def event_loop(self):
+        while True:
+            # Bez czekających zapisów pętla śpi do zdarzenia albo do najbliższego fsync dziennika
+            timeout = 0 if not KKW.empty() else self.idle_timeout()
+            for key, mask in self.selector.select(timeout):
+                try:
+                    key.data(key.fileobj, mask)
+                except Exception:
+                    self.handler_failed(key.fileobj)
+            self.drain_send_queue()
+            self.maintain_log()
+
+    def idle_timeout(self):
+        return self.log_store.timeout() if self.log_store is not None else None
+
+    def accept_client(self, server_socket, mask):
+        try:
+            client_socket, addr = server_socket.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+        except socket.error as e:
+            log.error('Błąd gniazda: %s', e)
+            return
+        client_socket.setblocking(False)
+        registry.add_client(client_socket)
+        self.connections[client_socket] = self.create_connection(client_socket)
+        self.selector.register(client_socket, selectors.EVENT_READ, self.client_event)
+
+    def client_event(self, client_socket, mask):
+        if mask & selectors.EVENT_READ:
+            self.read_client(client_socket)
+        if mask & selectors.EVENT_WRITE and client_socket in self.connections:
+            self.flush_connection(self.connections[client_socket])
+
+    def read_client(self, client_socket):
+        try:
+            data = client_socket.recv(RECV_SIZE)
+            messages = self.decode_messages(client_socket, data) if data else None
+        except (BlockingIOError, InterruptedError):
+            return
+        except ProtocolError as e:
+            log.warning('Client handler: Protocol error: %s', e)
+            messages = None
+        except socket.error:
+            log.warning('Client handler: Socket error: %s', client_socket)
+            messages = None
+        if messages is None:
+            self.disconnect_client(client_socket)
+            return
+        for message in messages:
+            self.accept_message(message, client_socket)
+            if client_socket.fileno() == -1:
+                break
+
+    def drain_send_queue(self):
+        # Tylko połączenia czekające na starcie - odtwarzanie dziennika nie zagłodzi odczytów
+        for _ in range(KKW.qsize()):
+            connection = KKW.get_nowait()
+            connection.scheduled = False
+            try:
+                self.flush_connection(connection)
+            except Exception:
+                self.handler_failed(connection.socket)
+
+    def flush_connection(self, connection):
+        client_socket = connection.socket
+        try:
+            done = connection.flush()
+        except socket.error as e:
+            log.warning('KKW: Error while message sending: %s', e)
+            self.disconnect_client(client_socket)
+            return
+        if client_socket not in self.connections:
+            return
+        connection.writable = not done
+        self.update_events(connection)
+        self.release_producers(connection)
+        if connection.replays:
+            self.pump_replay(connection)
+
+    def update_events(self, connection):
+        client_socket = connection.socket
+        events = 0 if connection.paused else selectors.EVENT_READ
+        if connection.writable:
+            events |= selectors.EVENT_WRITE
+        key = self.selector.get_map().get(client_socket)
+        if key is None:
+            if events:
+                self.selector.register(client_socket, events, self.callback_for(connection))
+        elif not events:
+            self.selector.unregister(client_socket)
+        elif key.events != events:
+            self.selector.modify(client_socket, events, key.data)
+
+    def callback_for(self, connection):
+        return self.client_event
+
+    def pause_reading(self, connection):
+        super().pause_reading(connection)
+        self.update_events(connection)
+
+    def resume_reading(self, connection):
+        super().resume_reading(connection)
+        self.update_events(connection)
+
+    def close_client_socket(self, client_socket):
+        if client_socket.fileno() != -1 and client_socket in self.selector.get_map():
+            self.selector.unregister(client_socket)
+        super().close_client_socket(client_socket)
+
+
+class ShardedServer(SelectorServer):
+    # Worker trybu wieloprocesowego: wszystkie workery słuchają na tym samym porcie (SO_REUSEPORT),
+    # temat należy do workera shard_for(temat), a komunikaty o cudzych tematach idą do właściciela przez IPC
+    def __init__(self, server_id, host, port, index, workers, **options):
+        self.index = index
+        self.workers = workers
+        super().__init__(server_id, host, port, **options)
+        self.peers = {}  # numer workera -> Connection wychodzącego łącza IPC
+        self.peer_sockets = set()
+        self.peer_inputs = {}  # gniazdo przychodzącego łącza -> [FrameDecoder, nagłówek czekający na treść]
+        self.tokens = {}  # lokalne gniazdo -> token klienta widziany przez inne workery
+        self.local_clients = {}  # token -> lokalne gniazdo
+        self.client_shards = {}  # lokalne gniazdo -> workery, do których trafiły jego komunikaty
+        self.remote_clients = {}  # (worker, token) -> RemoteClient
+        self.next_token = 0
+        self.pending_status = {}  # numer zapytania -> (gniazdo, odpowiedzi workerów)
+        self.remote_replays = {}  # numer workera -> {(RemoteClient, temat): następny offset do odtworzenia}
+        self.peer_retry = {}  # numer niedostępnego workera -> (czas następnej próby połączenia, odstęp)
+        self.paused_remote = {}  # producent z innego workera -> lokalne kolejki, które go wstrzymały
+        self.remote_held = {}  # wstrzymany producent z innego workera -> jego komunikaty czekające na wznowienie
+        self.held_deliveries = {}  # wstrzymany producent -> DELIVER od właściciela tematu czekające na wznowienie
+        self.next_status = 0
+
+        path = socket_path(server_id, port, index)
+        if os.path.exists(path):
+            os.unlink(path)
+        self.peer_server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.peer_server.bind(path)
+        self.peer_server.listen(workers)
+        self.peer_server.setblocking(False)
+        self.selector.register(self.peer_server, selectors.EVENT_READ, self.accept_peer)
+
+    def create_server_socket(self):
+        server_socket = super().create_server_socket()
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        return server_socket
+
+    def start(self):
+        # Bez konsoli - stdin zostaje w procesie nadrzędnym
+        self.wait_for_peers()
+        self.event_loop()
+
+    def wait_for_peers(self, timeout=5.0):
+        # Przy starcie czekamy, aż pozostałe workery otworzą gniazda IPC - później łącze do niedostępnego
+        # workera nie czeka, tylko od razu zgłasza błąd
+        deadline = time.monotonic() + timeout
+        for worker in range(self.workers):
+            while not os.path.exists(socket_path(self.server_id, self.port, worker)) and time.monotonic() < deadline:
+                time.sleep(0.05)
+
+    def dispatch(self, message_data, client_socket):
+        message_type = message_data['type']
+        topic = message_data['topic']
+        if message_type == 'status' or isinstance(client_socket, RemoteClient):
+            super().dispatch(message_data, client_socket)
+            return
+        if message_type in ('register', 'withdraw') and is_pattern(topic):
+            # Wzorzec może pasować do tematów dowolnego workera
+            super().dispatch(message_data, client_socket)
+            targets = [worker for worker in range(self.workers) if worker != self.index]
+        else:
+            owner = shard_for(topic, self.workers)
+            if owner == self.index:
+                super().dispatch(message_data, client_socket)
+                return
+            targets = [owner]
+            if message_type == 'register':
+                registry.clients[client_socket] = message_data['id']
+                if message_data['mode'] == 'subscriber':
+                    self.apply_subscriber_policy(message_data, client_socket)
+        token = self.token_for(client_socket)
+        for worker in targets:
+            self.client_shards[client_socket].add(worker)
+            self.send_peer(worker, {'kind': DISPATCH, 'worker': self.index, 'client': token, 'message': message_data},
+                           producer_socket=client_socket)
+
+    def token_for(self, client_socket):
+        token = self.tokens.get(client_socket)
+        if token is None:
+            self.next_token += 1
+            token = self.next_token
+            self.tokens[client_socket] = token
+            self.local_clients[token] = client_socket
+            self.client_shards[client_socket] = set()
+        return token
+
+    def remote_client(self, worker, token):
+        # Ten sam obiekt dla tego samego klienta, żeby był poprawnym kluczem w rejestrze
+        key = (worker, token)
+        client = self.remote_clients.get(key)
+        if client is None:
+            client = self.remote_clients[key] = RemoteClient(worker, token)
+        return client
+
+    def deliver(self, client_socket, body, header=None, producer_socket=None):
+        if isinstance(client_socket, RemoteClient):
+            self.send_peer(client_socket.worker, {'kind': DELIVER, 'clients': [client_socket.token],
+                                                  'producer': self.producer_ref(producer_socket)},
+                           body, producer_socket)
+            return
+        super().deliver(client_socket, body, header, producer_socket)
+
+    def producer_ref(self, producer_socket):
+        # Worker odbiorcy może poprosić workera producenta o wstrzymanie go (polityka block)
+        if isinstance(producer_socket, RemoteClient):
+            return [producer_socket.worker, producer_socket.token]
+        if producer_socket in self.connections and producer_socket not in self.peer_sockets:
+            return [self.index, self.token_for(producer_socket)]
+        return None
+
+    def producer_from(self, ref):
+        if ref is None:
+            return None
+        worker, token = ref
+        if worker == self.index:
+            return self.local_clients.get(token)
+        return RemoteClient(worker, token)
+
+    def congested(self, producer_socket, subscriber):
+        if isinstance(producer_socket, RemoteClient):
+            self.block_remote_producer(producer_socket, subscriber)
+        else:
+            super().congested(producer_socket, subscriber)
+
+    def block_remote_producer(self, client, subscriber):
+        # Odczyt od producenta wstrzymuje jego worker. Komunikaty, które są już w drodze, czekają: u właściciela
+        # tematu w remote_held, u workera subskrybenta w held_deliveries - limit kolejki nie jest przekraczany.
+        subscriber.blocked_producers.add(client)
+        blockers = self.paused_remote.get(client)
+        if blockers is None:
+            blockers = self.paused_remote[client] = set()
+            metrics.counter('producer_pauses_total').inc()
+            self.send_peer(client.worker, {'kind': PAUSE, 'worker': self.index, 'client': client.token})
+        blockers.add(subscriber)
+
+    def unblock_producer(self, producer, blocker):
+        if not isinstance(producer, RemoteClient):
+            super().unblock_producer(producer, blocker)
+            return
+        blockers = self.paused_remote.get(producer)
+        if blockers is None:
+            return
+        blockers.discard(blocker)
+        if blockers:
+            return
+        del self.paused_remote[producer]
+        self.deliver_held(producer)
+        self.dispatch_remote_held(producer)
+        if producer not in self.paused_remote:
+            self.send_peer(producer.worker, {'kind': RESUME, 'worker': self.index, 'client': producer.token})
+
+    def dispatch_remote_held(self, client):
+        held = self.remote_held.get(client)
+        while held and client not in self.paused_remote:
+            self.dispatch(held.popleft(), client)
+        if held is not None and not held:
+            del self.remote_held[client]
+
+    def dispatch_held(self, producer):
+        self.deliver_held(producer.socket)
+        super().dispatch_held(producer)
+
+    def producer_paused(self, producer_socket):
+        if isinstance(producer_socket, RemoteClient):
+            return producer_socket in self.paused_remote
+        connection = self.connections.get(producer_socket)
+        return connection is not None and connection.paused
+
+    def deliver_held(self, producer_socket, force=False):
+        held = self.held_deliveries.get(producer_socket)
+        while held and (force or not self.producer_paused(producer_socket)):
+            tokens, body = held.popleft()
+            self.deliver_local(tokens, body, producer_socket)
+        if held is not None and not held:
+            del self.held_deliveries[producer_socket]
+
+    def deliver_local(self, tokens, body, producer_socket):
+        for token in tokens:
+            client_socket = self.local_clients.get(token)
+            if client_socket is not None:
+                self.deliver(client_socket, body, producer_socket=producer_socket)
+
+    def peer_pause(self, worker, token):
+        connection = self.connections.get(self.local_clients.get(token))
+        if connection is None:
+            return
+        connection.blocked_by.add(('worker', worker))
+        if not connection.paused:
+            log.debug('Backpressure: Pausing %s for worker %s', registry.clients.get(connection.socket), worker)
+            self.pause_reading(connection)
+
+    def peer_resume(self, worker, token):
+        connection = self.connections.get(self.local_clients.get(token))
+        if connection is not None:
+            self.unblock_producer(connection, ('worker', worker))
+
+    def replay_from(self, client_socket, topic, offset):
+        if not isinstance(client_socket, RemoteClient):
+            super().replay_from(client_socket, topic, offset)
+            return
+        # Klient innego workera - zaległości idą łączem IPC porcjami, kolejne dopiero gdy łącze się opróżni
+        self.remote_replays.setdefault(client_socket.worker, {})[(client_socket, topic)] = offset
+        self.pump_remote_replay(client_socket.worker)
+
+    def pump_remote_replay(self, worker):
+        replays = self.remote_replays.get(worker)
+        link = self.peer_link(worker) if replays else None
+        budget = max(1, self.max_outbox // 2)
+        while replays and link is not None and len(link.outbox) < budget:
+            (client, topic), offset = next(iter(replays.items()))
+            records = self.log_store.read(topic, offset, budget)
+            for offset, body in records:
+                self.deliver(client, body)
+            if len(records) < budget:
+                del replays[(client, topic)]
+            else:
+                replays[(client, topic)] = offset + 1
+        if not replays or link is None:
+            self.remote_replays.pop(worker, None)
+
+    def replaying(self, client_socket, topic):
+        if isinstance(client_socket, RemoteClient):
+            return (client_socket, topic) in self.remote_replays.get(client_socket.worker, ())
+        return super().replaying(client_socket, topic)
+
+    def stop_replay(self, client_socket, topic):
+        if isinstance(client_socket, RemoteClient):
+            self.remote_replays.get(client_socket.worker, {}).pop((client_socket, topic), None)
+            return
+        super().stop_replay(client_socket, topic)
+
+    def stop_remote_replays(self, client):
+        replays = self.remote_replays.get(client.worker, {})
+        for key in [key for key in replays if key[0] is client]:
+            del replays[key]
+
+    def flush_connection(self, connection):
+        super().flush_connection(connection)
+        for worker in list(self.remote_replays):
+            if self.peers.get(worker) is connection:
+                self.pump_remote_replay(worker)
+
+    def deliver_many(self, subscriber_sockets, body, header, producer_socket=None):
+        # Jedna kopia treści na workera, nie na zdalnego subskrybenta
+        local = []
+        remote = {}
+        for subscriber_socket in subscriber_sockets:
+            if isinstance(subscriber_socket, RemoteClient):
+                remote.setdefault(subscriber_socket.worker, []).append(subscriber_socket.token)
+            else:
+                local.append(subscriber_socket)
+        super().deliver_many(local, body, header, producer_socket)
+        if remote:
+            producer = self.producer_ref(producer_socket)
+            for worker, tokens in remote.items():
+                self.send_peer(worker, {'kind': DELIVER, 'clients': tokens, 'producer': producer}, body,
+                               producer_socket)
+
+    def handle_status(self, message_data, client_socket):
+        log.debug('Status: %s', message_data)
+        self.next_status += 1
+        request = self.next_status
+        parts = {self.index: self.status_payload()}
+        self.pending_status[request] = (client_socket, parts)
+        for worker in range(self.workers):
+            if worker == self.index:
+                continue
+            if not self.send_peer(worker, {'kind': STATUS, 'request': request, 'worker': self.index}):
+                parts[worker] = None
+        self.complete_status(request)
+
+    def complete_status(self, request):
+        client_socket, parts = self.pending_status[request]
+        if len(parts) < self.workers:
+            return
+        del self.pending_status[request]
+        if client_socket in self.connections:
+            self.send_status(client_socket, merge_status(parts))
+
+    def check_users_to_delete(self, subs_to_delete):
+        # Lokalny klient z subskrypcjami u innych workerów nie jest bezczynny
+        super().check_users_to_delete({id: sock for id, sock in subs_to_delete.items()
+                                       if not self.client_shards.get(sock)})
+
+    def disconnect_client(self, client_socket):
+        if isinstance(client_socket, RemoteClient):
+            # Właściciel tematu nie ma już nic dla klienta - rozłączyć go może tylko jego worker
+            if self.drop_remote_client(client_socket.worker, client_socket.token):
+                self.send_peer(client_socket.worker, {'kind': ORPHAN, 'worker': self.index,
+                                                      'client': client_socket.token})
+            return
+        token = self.tokens.pop(client_socket, None)
+        if token is not None:
+            del self.local_clients[token]
+            for worker in self.client_shards.pop(client_socket):
+                self.send_peer(worker, {'kind': DISCONNECT, 'worker': self.index, 'client': token})
+        if client_socket in self.peer_sockets:
+            self.peer_sockets.discard(client_socket)
+            for worker, link in list(self.peers.items()):
+                if link.socket is client_socket:
+                    self.peer_lost(worker)
+        super().disconnect_client(client_socket)
+        self.deliver_held(client_socket, force=True)  # Opublikowane przed rozłączeniem producenta
+
+    def peer_lost(self, worker):
+        # Zapytania o status nie czekają na odpowiedź, która już nie przyjdzie
+        del self.peers[worker]
+        self.remote_replays.pop(worker, None)
+        # Producenci wstrzymani na prośbę utraconego workera nie doczekają się RESUME
+        for connection in list(self.connections.values()):
+            if ('worker', worker) in connection.blocked_by:
+                self.unblock_producer(connection, ('worker', worker))
+        for client in [client for client in self.paused_remote if client.worker == worker]:
+            del self.paused_remote[client]
+            self.remote_held.pop(client, None)
+            self.deliver_held(client, force=True)
+        for request, (_, parts) in list(self.pending_status.items()):
+            if worker not in parts:
+                parts[worker] = None
+                self.complete_status(request)
+
+    def drop_remote_client(self, worker, token):
+        client = self.remote_clients.pop((worker, token), None)
+        if client is None:
+            return False
+        with self.state_lock:
+            self.stop_remote_replays(client)
+            self.paused_remote.pop(client, None)
+            self.remote_held.pop(client, None)
+            self.deliver_held(client, force=True)
+            subs_to_delete = self.remove_client(client)
+            self.check_users_to_delete(subs_to_delete)
+        return True
+
+    def handle_orphan(self, worker, token):
+        client_socket = self.local_clients.get(token)
+        if client_socket is None:
+            return
+        shards = self.client_shards[client_socket]
+        shards.discard(worker)
+        if not shards and registry.is_idle(client_socket):
+            log.info('Disconnecting: %s, %s', registry.clients.get(client_socket), client_socket)
+            self.disconnect_idle(client_socket)
+
+    def send_peer(self, worker, header, body=None, producer_socket=None):
+        # Pełne łącze wstrzymuje producenta, którego komunikaty do niego trafiają - jak wolny subskrybent
+        link = self.peer_link(worker)
+        if link is None:
+            return False
+        result = link.enqueue(encode_body(header))
+        if body is not None:
+            result = link.enqueue(body)
+        if result == CONGESTED:
+            self.congested(producer_socket, link)
+        self.schedule_flush(link)
+        return True
+
+    def peer_link(self, worker):
+        link = self.peers.get(worker)
+        if link is not None and link.socket.fileno() != -1:
+            return link
+        retry = self.peer_retry.get(worker)
+        if retry is not None and time.monotonic() < retry[0]:
+            return None  # Worker niedostępny - nie czekamy w pętli zdarzeń, kolejna próba po odstępie
+        peer_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        peer_socket.setblocking(False)
+        try:
+            peer_socket.connect(socket_path(self.server_id, self.port, worker))
+        except OSError as e:
+            peer_socket.close()
+            delay = min(retry[1] * 2, PEER_RETRY_MAX) if retry is not None else PEER_RETRY_MIN
+            self.peer_retry[worker] = (time.monotonic() + delay, delay)
+            if retry is None:
+                log.error('Shard: Worker %s is unreachable: %s', worker, e)
+            return None
+        if retry is not None:
+            log.info('Shard: Worker %s is reachable again', worker)
+            del self.peer_retry[worker]
+        link = self.peers[worker] = Connection(peer_socket, self.max_outbox, BLOCK)
+        link.enqueue_raw(handshake())
+        self.schedule_flush(link)
+        self.connections[peer_socket] = link
+        self.peer_sockets.add(peer_socket)
+        registry.add_client(peer_socket, f'worker-{worker}')
+        self.selector.register(peer_socket, selectors.EVENT_READ, self.peer_link_event)
+        return link
+
+    def callback_for(self, connection):
+        if connection.socket in self.peer_sockets:
+            return self.peer_link_event
+        return super().callback_for(connection)
+
+    def peer_link_event(self, peer_socket, mask):
+        if mask & selectors.EVENT_READ:
+            # Łącze wychodzące jest jednokierunkowe - odczyt oznacza tylko zamknięcie po drugiej stronie
+            try:
+                closed = not peer_socket.recv(RECV_SIZE)
+            except (BlockingIOError, InterruptedError):
+                closed = False
+            except socket.error:
+                closed = True
+            if closed:
+                log.error('Shard: Lost link to %s', registry.clients.get(peer_socket))
+                self.disconnect_client(peer_socket)
+                return
+        if mask & selectors.EVENT_WRITE and peer_socket in self.connections:
+            self.flush_connection(self.connections[peer_socket])
+
+    def accept_peer(self, peer_server, mask):
+        try:
+            peer_socket, _ = peer_server.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+        peer_socket.setblocking(False)
+        self.peer_inputs[peer_socket] = [FrameDecoder(), None]
+        self.selector.register(peer_socket, selectors.EVENT_READ, self.peer_input_event)
+
+    def peer_input_event(self, peer_socket, mask):
+        state = self.peer_inputs[peer_socket]
+        try:
+            data = peer_socket.recv(RECV_SIZE)
+            frames = state[0].feed(data) if data else None
+        except (BlockingIOError, InterruptedError):
+            return
+        except (ProtocolError, socket.error) as e:
+            log.error('Shard: Peer link error: %s', e)
+            frames = None
+        if frames is None:
+            self.selector.unregister(peer_socket)
+            del self.peer_inputs[peer_socket]
+            peer_socket.close()
+            return
+        for frame in frames:
+            if state[1] is not None:
+                header, state[1] = state[1], None
+                self.handle_peer_message(header, frame)
+                continue
+            header = json.loads(frame)
+            if header['kind'] == DELIVER:
+                state[1] = header  # Następna ramka to treść komunikatu
+            else:
+                self.handle_peer_message(header, None)
+
+    def handle_peer_message(self, header, body):
+        kind = header['kind']
+        with self.state_lock:
+            if kind == DISPATCH:
+                client = self.remote_client(header['worker'], header['client'])
+                if client in self.paused_remote or client in self.remote_held:
+                    self.remote_held.setdefault(client, deque()).append(header['message'])
+                else:
+                    self.dispatch(header['message'], client)
+            elif kind == DELIVER:
+                producer = self.producer_from(header.get('producer'))
+                if producer is not None and (producer in self.held_deliveries or self.producer_paused(producer)):
+                    self.held_deliveries.setdefault(producer, deque()).append((header['clients'], body))
+                else:
+                    self.deliver_local(header['clients'], body, producer)
+            elif kind == PAUSE:
+                self.peer_pause(header['worker'], header['client'])
+            elif kind == RESUME:
+                self.peer_resume(header['worker'], header['client'])
+            elif kind == DISCONNECT:
+                self.drop_remote_client(header['worker'], header['client'])
+            elif kind == ORPHAN:
+                self.handle_orphan(header['worker'], header['client'])
+            elif kind == STATUS:
+                self.send_peer(header['worker'], {'kind': STATUS_REPLY, 'request': header['request'],
+                                                  'worker': self.index, 'status': self.status_payload()})
+            elif kind == STATUS_REPLY:
+                if header['request'] in self.pending_status:
+                    self.pending_status[header['request']][1][header['worker']] = header['status']
+                    self.complete_status(header['request'])
+            else:
+                log.warning('Shard: unsupported peer message %s', kind)
+
+
+def raise_fd_limit():
+    # Podniesienie limitu deskryptorów, żeby obsłużyć kilkadziesiąt tysięcy połączeń
+    if resource is None:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def load_config(config_file):
+    with open(config_file, 'r') as file:
+        config = json.load(file)
+    return config
+
+def server_options(config):
+    return {
+        'queue_size': config.get('QueueSize', 10000),
+        'max_outbox': config.get('MaxOutbox', 10000),
+        'policy': config.get('SlowConsumerPolicy', DROP_OLDEST),
+        'log_store': create_log_store(config.get('Log')),
+        'metrics_port': config.get('MetricsPort'),
+    }
+
+
+def configure_logging(config):
+    # LogLevel: debug/info/warning/error; LogSampleEvery: co który komunikat debug danego rodzaju jest wypisywany
+    log.configure(config.get('LogLevel', 'info'), config.get('LogSampleEvery', 1))
+
+
+def create_log_store(log_config):
+    if not log_config or not log_config.get('Enabled', True):
+        return None
+    return LogStore(
+        log_config.get('Directory', 'data'),
+        segment_bytes=log_config.get('SegmentBytes', 64 * 1024 * 1024),
+        retention_bytes=log_config.get('RetentionBytes'),
+        retention_seconds=log_config.get('RetentionSeconds'),
+        segment_seconds=log_config.get('SegmentSeconds'),
+        retention_interval=log_config.get('RetentionCheckIntervalMs', 1000) / 1000,
+        fsync_interval=log_config.get('FsyncIntervalMs', 200) / 1000,
+        fsync_messages=log_config.get('FsyncMessages', 1000),
+    )
+
+
+def run_worker(config, index):
+    configure_logging(config)
+    options = server_options(config)
+    if options['metrics_port']:
+        options['metrics_port'] += index  # Każdy worker ma własny endpoint
+    server = ShardedServer(config['ServerID'], config['Host'], config['Port'], index, config['Workers'], **options)
+    server.start()
+
+
+def start_worker(config, index):
+    process = multiprocessing.Process(target=run_worker, args=(config, index))
+    process.start()
+    return process
+
+
+def supervise_workers(config):
+    # Proces nadrzędny uruchamia workery i wznawia te, które się zakończyły; worker padający zaraz
+    # po starcie jest wznawiany z opóźnieniem, żeby nie kręcić się w pętli
+    processes = {index: start_worker(config, index) for index in range(config['Workers'])}
+    started = {index: time.monotonic() for index in processes}
+    print(f'Serwer {config["ServerID"]}: started {len(processes)} workers')
+    try:
+        while True:
+            ended = multiprocessing.connection.wait([process.sentinel for process in processes.values()])
+            for index, process in list(processes.items()):
+                if process.sentinel not in ended:
+                    continue
+                process.join()
+                print(f'Serwer {config["ServerID"]}: worker {index} exited with code {process.exitcode}, restarting')
+                if time.monotonic() - started[index] < WORKER_RESTART_DELAY:
+                    time.sleep(WORKER_RESTART_DELAY)
+                processes[index] = start_worker(config, index)
+                started[index] = time.monotonic()
+    except KeyboardInterrupt:
+        for process in processes.values():
+            process.terminate()
+
+
+if __name__ == "__main__":
+    # Ścieżka do konfiguracji jako argument (np. benchmark.py), domyślnie config.json
+    config = load_config(sys.argv[1] if len(sys.argv) > 1 else 'config.json')
+    server_id = config['ServerID']
+    host = config['Host']
+    port = config['Port']
+    mode = config.get('ServerMode', 'threaded')
+    workers = config.get('Workers', 1)
+
+    if workers > 1:
+        if not hasattr(socket, 'SO_REUSEPORT') or not hasattr(socket, 'AF_UNIX'):
+            raise ValueError('Workers > 1 requires SO_REUSEPORT and Unix sockets')
+        supervise_workers(config)
+    else:
+        configure_logging(config)
+        options = server_options(config)
+        if mode == 'selectors':
+            server = SelectorServer(server_id, host, port, **options)
+        elif mode == 'threaded':
+            server = Server(server_id, host, port, **options)
+        else:
+            raise ValueError(f'Unsupported ServerMode: {mode}')
+        server.start()
@@ -0,0 +1,68 @@
+import os
+import tempfile
+import zlib
+
+# Rodzaje komunikatów między workerami (kanał IPC po gniazdach Unix, ramki z protocol.py)
+DISPATCH = 'dispatch'  # Komunikat klienta przekazany do właściciela tematu
+DELIVER = 'deliver'  # Gotowa treść do wysłania lokalnym klientom workera (następna ramka to treść)
+DISCONNECT = 'disconnect'  # Klient rozłączył się ze swoim workerem
+ORPHAN = 'orphan'  # Właściciel tematu nie ma już nic dla klienta
+STATUS = 'status'
+STATUS_REPLY = 'status_reply'
+PAUSE = 'pause'  # Wstrzymaj odczyt od swojego klienta-producenta (polityka block u innego workera)
+RESUME = 'resume'
+
+# Odstęp między próbami połączenia z niedostępnym workerem (sekundy, podwajany do maksimum)
+PEER_RETRY_MIN = 0.1
+PEER_RETRY_MAX = 5.0
+
+
+def shard_for(topic, workers):
+    # crc32 zamiast hash(), żeby wszystkie procesy liczyły ten sam podział
+    return zlib.crc32(topic.encode()) % workers
+
+
+def socket_path(server_id, port, index):
+    return os.path.join(tempfile.gettempdir(), f'ps-{server_id}-{port}-{index}.sock')
+
+
+class RemoteClient:
+    # Zastępuje gniazdo klienta podłączonego do innego workera w rejestrze właściciela tematu
+    __slots__ = ('worker', 'token')
+
+    def __init__(self, worker, token):
+        self.worker = worker
+        self.token = token
+
+    def fileno(self):
+        return -1
+
+    def __eq__(self, other):
+        return isinstance(other, RemoteClient) and (self.worker, self.token) == (other.worker, other.token)
+
+    def __hash__(self):
+        return hash((self.worker, self.token))
+
+    def __repr__(self):
+        return f'<RemoteClient worker={self.worker} token={self.token}>'
+
+
+def merge_status(parts):
+    # Tematy są rozłączne między workerami, wzorce są zarejestrowane u wszystkich
+    merged = {
+        "registered_topics": {},
+        "wildcard_subscriptions": {},
+        "workers": {},
+    }
+    for index, part in sorted(parts.items()):
+        if part is None:
+            merged["workers"][str(index)] = {"error": "unreachable"}
+            continue
+        merged["registered_topics"].update(part["registered_topics"])
+        for pattern, subscribers in part["wildcard_subscriptions"].items():
+            known = merged["wildcard_subscriptions"].setdefault(pattern, [])
+            known.extend(subscriber for subscriber in subscribers if subscriber not in known)
+        merged["workers"][str(index)] = {"queues": part["queues"], "metrics": part.get("metrics")}
+        if "log" in part:
+            merged.setdefault("log", {}).update(part["log"])
+    return merged
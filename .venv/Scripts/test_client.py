@@ -0,0 +1,87 @@
+import json
+import socket
+import threading
+import time
+
+from client import SPClientAPI
+from protocol import FrameDecoder, encode_frame, handshake
+
+
+def test_control_messages_keep_order_with_batching():
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(('127.0.0.1', 0))
+    server.listen(1)
+    client = SPClientAPI(linger_ms=50, batch_size=100, callback_workers=0)
+    client.start('127.0.0.1', server.getsockname()[1], 'P')
+    connection, _ = server.accept()
+    connection.settimeout(5)
+    try:
+        client.create_producer('t')
+        for i in range(10):
+            client.produce('t', {'v': i})
+        client.withdraw_producer('t')
+        decoder = FrameDecoder()
+        received = []
+        while len(received) < 12:
+            data = connection.recv(65536)
+            assert data
+            received += [json.loads(body) for body in decoder.feed(data)]
+        assert [message['type'] for message in received] == ['register'] + ['message'] * 10 + ['withdraw']
+        assert [message['payload']['v'] for message in received[1:11]] == list(range(10))
+    finally:
+        client.stop()
+        connection.close()
+        server.close()
+
+
+def test_batch_buffer_is_bounded_when_server_stops_reading():
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 65536)
+    server.bind(('127.0.0.1', 0))
+    server.listen(1)
+    client = SPClientAPI(linger_ms=5, batch_size=10, callback_workers=0, max_buffered=50)
+    client.start('127.0.0.1', server.getsockname()[1], 'P')
+    connection, _ = server.accept()
+    client.topics_produced.add('t')
+    payload = {'d': 'x' * 10000}
+    producer = threading.Thread(target=lambda: [client.produce('t', payload) for _ in range(2000)], daemon=True)
+    try:
+        producer.start()
+        time.sleep(0.5)
+        assert producer.is_alive()  # Serwer nie czyta - produce() czeka zamiast buforować bez końca
+        assert len(client.batch) <= 50
+        received = 0
+        connection.settimeout(5)
+        while producer.is_alive() or client.sent < client.queued:
+            received += len(connection.recv(1 << 20))
+        assert client.sent == client.queued == 2000
+    finally:
+        client.stop()
+        connection.close()
+        server.close()
+
+
+def test_subscriber_callback_receives_offset_and_timestamp():
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(('127.0.0.1', 0))
+    server.listen(1)
+    client = SPClientAPI(callback_workers=2)
+    client.start('127.0.0.1', server.getsockname()[1], 'S')
+    connection, _ = server.accept()
+    plain, described = [], []
+    done = threading.Event()
+    try:
+        client.create_subscriber('t', lambda payload: plain.append(payload))
+        client.create_subscriber('t/#', lambda payload, metadata: (described.append((payload, metadata)), done.set()),
+                                 metadata=True)
+        message = {'type': 'message', 'id': 'P', 'topic': 't/a', 'mode': 'producer',
+                   'timestamp': '2024-01-01T00:00:00', 'payload': {'v': 1}, 'offset': 7}
+        connection.sendall(handshake() + encode_frame(message) + encode_frame(dict(message, topic='t', offset=8)))
+        assert done.wait(5)
+        client.callbacks.join()
+        assert plain == [{'v': 1}]
+        assert described == [({'v': 1}, {'topic': 't/a', 'id': 'P', 'offset': 7, 'timestamp': '2024-01-01T00:00:00'})]
+    finally:
+        client.stop()
+        connection.close()
+        server.close()
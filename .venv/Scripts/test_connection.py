@@ -0,0 +1,86 @@
+import socket
+
+import pytest
+
+from connection import (BLOCK, CONGESTED, DISCONNECT, DROPPED, DROP_NEWEST, DROP_OLDEST, OVERFLOW, QUEUED,
+                        Connection)
+from protocol import FRAME_HEADER
+
+
+@pytest.fixture
+def connection():
+    left, right = socket.socketpair()
+    yield Connection(left, max_outbox=4)
+    left.close()
+    right.close()
+
+
+@pytest.mark.parametrize('max_outbox', [[1], {}, 'dużo', 0, -5])
+def test_set_policy_rejects_invalid_max_outbox(connection, max_outbox):
+    with pytest.raises(ValueError):
+        connection.set_policy(BLOCK, max_outbox)
+    assert connection.max_outbox == 4
+    assert connection.policy != BLOCK
+
+
+def test_set_policy(connection):
+    connection.set_policy(DROP_NEWEST, '10')
+    assert (connection.policy, connection.max_outbox) == (DROP_NEWEST, 10)
+    with pytest.raises(ValueError):
+        connection.set_policy('ignore')
+
+
+def bodies(connection):
+    return [bytes(message[-1]) for message in connection.outbox]
+
+
+def fill(connection, policy, count):
+    connection.set_policy(policy)
+    return [connection.enqueue(b'%d' % i) for i in range(count)]
+
+
+def test_drop_oldest(connection):
+    assert fill(connection, DROP_OLDEST, 6) == [QUEUED] * 6
+    assert bodies(connection) == [b'2', b'3', b'4', b'5']
+    assert connection.dropped == 2
+    assert connection.outbox_bytes == 4 * (FRAME_HEADER.size + 1)
+
+
+def test_drop_oldest_keeps_partially_sent_message(connection):
+    fill(connection, DROP_OLDEST, 4)
+    connection.consume(2)  # Wysłana część nagłówka pierwszego komunikatu
+    assert connection.enqueue(b'4') == QUEUED
+    assert bodies(connection) == [b'0', b'2', b'3', b'4']
+    assert connection.partial
+
+
+def test_drop_newest(connection):
+    assert fill(connection, DROP_NEWEST, 6) == [QUEUED] * 4 + [DROPPED] * 2
+    assert bodies(connection) == [b'0', b'1', b'2', b'3']
+    assert connection.dropped == 2
+
+
+def test_disconnect(connection):
+    assert fill(connection, DISCONNECT, 5) == [QUEUED] * 4 + [OVERFLOW]
+    assert bodies(connection) == [b'0', b'1', b'2', b'3']
+
+
+def test_block(connection):
+    # Nic nie jest gubione - CONGESTED oznacza, że producenta trzeba wstrzymać
+    assert fill(connection, BLOCK, 5) == [QUEUED] * 3 + [CONGESTED] * 2
+    assert bodies(connection) == [b'0', b'1', b'2', b'3', b'4']
+    assert connection.dropped == 0
+    assert not connection.below_low_watermark()
+
+
+def test_flush_sends_outbox_in_order():
+    left, right = socket.socketpair()
+    try:
+        connection = Connection(left, max_outbox=4)
+        fill(connection, BLOCK, 4)
+        assert connection.flush()
+        assert connection.outbox_bytes == 0 and not connection.outbox
+        assert right.recv(1024) == b''.join(FRAME_HEADER.pack(1) + b'%d' % i for i in range(4))
+    finally:
+        left.close()
+        right.close()
@@ -0,0 +1,32 @@
+import threading
+
+from metrics import Metrics
+
+
+def test_counter_from_many_threads():
+    metrics = Metrics()
+
+    def worker():
+        for _ in range(10000):
+            metrics.counter('connections_accepted_total').inc()
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert metrics.counter('connections_accepted_total').value == 80000
+
+
+def test_drop_labels_removes_topic_series():
+    metrics = Metrics()
+    metrics.counter('messages_published_total', topic='a').inc()
+    metrics.counter('messages_published_total', topic='b').inc()
+    metrics.counter('messages_unroutable_total').inc()
+    assert 'topic=a' in metrics.snapshot()['messages_published_per_second']
+    metrics.drop_labels(topic='a')
+    snapshot = metrics.snapshot()
+    assert list(snapshot['messages_published_total']) == ['topic=b']
+    assert list(snapshot['messages_published_per_second']) == ['topic=b']
+    assert snapshot['messages_unroutable_total'] == 1
+    assert 'topic="a"' not in metrics.prometheus()
@@ -0,0 +1,66 @@
+import json
+
+import pytest
+
+from protocol import FrameDecoder, ProtocolError, encode_frame, handshake
+
+MESSAGES = [
+    {"type": "message", "id": "P", "topic": "dom/kuchnia", "mode": "producer", "timestamp": "2024-05-01T12:00:00",
+     "payload": {"content": "zażółć gęślą jaźń", "temp": 1500.25, "ok": True, "error": False, "extra": None,
+                 "nested": [1, -2.5e3, {"a": "\"}{"}]}},
+    {"type": "status", "id": "P", "topic": "logs", "mode": "producer", "timestamp": "2024-05-01T12:00:01",
+     "payload": {}},
+]
+
+
+def feed_split(decoder, data, split):
+    return decoder.feed(data[:split]) + decoder.feed(data[split:])
+
+
+def test_framed_split_at_every_offset():
+    data = handshake() + b''.join(encode_frame(message) for message in MESSAGES)
+    for split in range(len(data) + 1):
+        decoder = FrameDecoder()
+        bodies = feed_split(decoder, data, split)
+        assert [json.loads(body) for body in bodies] == MESSAGES, split
+        assert not decoder.legacy
+
+
+def test_legacy_split_at_every_offset():
+    # json.dumps escapuje polskie znaki (\\uXXXX) - podział w środku escape'u, liczby czy literału
+    data = ''.join(json.dumps(message) for message in MESSAGES).encode()
+    for split in range(len(data) + 1):
+        decoder = FrameDecoder()
+        bodies = feed_split(decoder, data, split)
+        assert [json.loads(body) for body in bodies] == MESSAGES, split
+        assert decoder.legacy
+
+
+def test_legacy_utf8_split_at_every_offset():
+    data = ''.join(json.dumps(message, ensure_ascii=False) for message in MESSAGES).encode()
+    for split in range(len(data) + 1):
+        decoder = FrameDecoder()
+        assert [json.loads(body) for body in feed_split(decoder, data, split)] == MESSAGES, split
+
+
+def test_legacy_byte_by_byte():
+    data = ' '.join(json.dumps(message) for message in MESSAGES).encode()
+    decoder = FrameDecoder()
+    bodies = []
+    for index in range(len(data)):
+        bodies += decoder.feed(data[index:index + 1])
+    assert [json.loads(body) for body in bodies] == MESSAGES
+
+
+def test_legacy_malformed_message_does_not_break_stream():
+    decoder = FrameDecoder()
+    bodies = decoder.feed(b'{"type": tru}' + json.dumps(MESSAGES[1]).encode())
+    assert len(bodies) == 2
+    with pytest.raises(json.JSONDecodeError):
+        json.loads(bodies[0])
+    assert json.loads(bodies[1]) == MESSAGES[1]
+
+
+def test_unknown_preamble():
+    with pytest.raises(ProtocolError):
+        FrameDecoder().feed(b'GET / HTTP/1.1\r\n')
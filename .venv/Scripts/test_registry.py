@@ -0,0 +1,74 @@
+from itertools import product
+
+import pytest
+
+from registry import Registry, TopicTrie, matches
+
+LEVELS = ['a', 'b', '+']
+TOPIC_LEVELS = ['a', 'b', 'c']
+
+
+def all_patterns():
+    for depth in range(1, 4):
+        for levels in product(LEVELS, repeat=depth):
+            yield '/'.join(levels)
+            yield '/'.join(levels + ('#',))
+    yield '#'
+
+
+def all_topics():
+    for depth in range(1, 5):
+        for levels in product(TOPIC_LEVELS, repeat=depth):
+            yield '/'.join(levels)
+
+
+def test_trie_match_agrees_with_matches():
+    trie = TopicTrie()
+    patterns = {pattern: f'c{index}' for index, pattern in enumerate(all_patterns())}
+    for pattern, client_id in patterns.items():
+        trie.add(pattern, client_id, object())
+    for topic in all_topics():
+        expected = {client_id for pattern, client_id in patterns.items() if matches(pattern, topic)}
+        assert set(trie.match(topic)) == expected, topic
+
+
+def test_trie_remove_prunes_empty_nodes():
+    trie = TopicTrie()
+    trie.add('a/+/c', 'x', object())
+    trie.add('a/#', 'y', object())
+    assert trie.remove('a/+/c', 'x')
+    assert not trie.remove('a/+/c', 'x')
+    assert list(trie.root.children['a'].children) == ['#']
+    assert trie.remove('a/#', 'y')
+    assert trie.root.children == {} and trie.patterns == {}
+
+
+@pytest.mark.parametrize('pattern', ['a/#/b', 'a+/b', 'a/b#'])
+def test_trie_rejects_invalid_patterns(pattern):
+    with pytest.raises(ValueError):
+        TopicTrie().add(pattern, 'x', object())
+
+
+def test_remove_client_cleans_every_index():
+    registry = Registry()
+    client, other = object(), object()
+    registry.add_client(client, 'C')
+    registry.add_client(other, 'O')
+    registry.add_producer('own', 'C', client)
+    registry.add_producer('shared', 'O', other)
+    registry.add_subscriber('own', 'O', other)
+    registry.add_subscriber('shared', 'C', client)
+    registry.add_subscriber('shared/#', 'C', client)
+    registry.add_subscriber('+/x', 'C', client)
+
+    orphans = registry.remove_client(client)
+
+    assert orphans == {'O': other}  # Subskrybent tematu, który zniknął razem z producentem
+    assert 'own' not in registry.topics
+    assert registry.topics['shared']['subscribers'] == {}
+    assert registry.wildcards.patterns == {} and registry.wildcards.root.children == {}
+    assert client not in registry.clients and client not in registry.memberships
+    assert registry.memberships[other] == {'produced': {'shared'}, 'subscribed': set()}
+    assert registry.subscribers_of('shared/x') == {}
+    assert not registry.is_idle(other)
+    assert registry.remove_client(client) == {}
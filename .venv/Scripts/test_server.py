@@ -0,0 +1,147 @@
+import json
+import socket
+import threading
+import time
+
+import pytest
+
+import connection
+import server
+from protocol import FrameDecoder, encode_frame, handshake
+
+
+threaded_broker = None
+
+
+def start_server(mode):
+    global threaded_broker
+    if mode == 'selectors':
+        broker = server.SelectorServer('test', '127.0.0.1', 0)
+        threads = [broker.event_loop]
+    elif threaded_broker is not None:
+        # KKO i KKW są globalne - drugi serwer wątkowy w tym samym procesie zabierałby komunikaty pierwszemu
+        return threaded_broker, threaded_broker.server_socket.getsockname()[1]
+    else:
+        broker = threaded_broker = server.Server('test', '127.0.0.1', 0)
+        broker.write_selector = server.selectors.DefaultSelector()
+        threads = [broker.communication_thread, broker.monitoring_thread, broker.writable_thread]
+    for target in threads:
+        threading.Thread(target=target, daemon=True).start()
+    return broker, broker.server_socket.getsockname()[1]
+
+
+class RawClient:
+    def __init__(self, port, client_id):
+        self.id = client_id
+        self.socket = socket.create_connection(('127.0.0.1', port))
+        self.socket.settimeout(5)
+        self.socket.sendall(handshake())
+        self.decoder = FrameDecoder()
+        self.pending = []
+
+    def send(self, message_type, topic, mode, payload=None):
+        self.socket.sendall(encode_frame({'type': message_type, 'id': self.id, 'topic': topic, 'mode': mode,
+                                          'timestamp': '2024-05-01T12:00:00', 'payload': payload or {}}))
+
+    def receive(self):
+        while not self.pending:
+            data = self.socket.recv(65536)
+            if not data:
+                return None
+            self.pending.extend(self.decoder.feed(data))
+        return json.loads(self.pending.pop(0))
+
+    def close(self):
+        self.socket.close()
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+@pytest.mark.parametrize('mode', ['selectors', 'threaded'])
+def test_handler_error_disconnects_only_that_client(mode, monkeypatch):
+    broker, port = start_server(mode)
+
+    def broken_status(message_data, client_socket):
+        raise RuntimeError('boom')
+
+    monkeypatch.setattr(broker, 'handle_status', broken_status)
+    producer = RawClient(port, f'{mode}-P')
+    subscriber = RawClient(port, f'{mode}-S')
+    faulty = RawClient(port, f'{mode}-F')
+    try:
+        producer.send('register', f'{mode}/t', 'producer')
+        assert wait_for(lambda: f'{mode}/t' in server.registry.topics)
+        subscriber.send('register', f'{mode}/t', 'subscriber')
+        assert wait_for(lambda: server.registry.topics[f'{mode}/t']['subscribers'])
+        faulty.send('status', 'logs', 'producer')
+        assert faulty.receive() is None  # Rozłączony tylko klient, którego obsługa się wysypała
+        producer.send('message', f'{mode}/t', 'producer', {'v': 1})
+        assert subscriber.receive()['payload'] == {'v': 1}
+    finally:
+        for client in (producer, subscriber, faulty):
+            client.close()
+
+
+def test_non_string_topic_and_id_are_rejected():
+    broker, port = start_server('selectors')
+    producer = RawClient(port, 'V-P')
+    subscriber = RawClient(port, 'V-S')
+    try:
+        producer.send('register', 'v/t', 'producer')
+        subscriber.send('register', 'v/#', 'subscriber')
+        assert wait_for(lambda: 'v/#' in server.registry.wildcards.patterns)
+        producer.send('register', 123, 'producer')
+        producer.send('message', ['v', 't'], 'producer', {'v': 0})
+        producer.socket.sendall(encode_frame({'type': 'register', 'id': 7, 'topic': 'v/x', 'mode': 'producer',
+                                              'timestamp': '2024-05-01T12:00:00', 'payload': {}}))
+        producer.send('message', 'v/t', 'producer', {'v': 1})
+        assert subscriber.receive()['payload'] == {'v': 1}
+        assert 123 not in server.registry.topics and 'v/x' not in server.registry.topics
+    finally:
+        producer.close()
+        subscriber.close()
+
+
+def test_invalid_subscriber_policy_keeps_server_running():
+    broker, port = start_server('selectors')
+    producer = RawClient(port, 'Q-P')
+    subscriber = RawClient(port, 'Q-S')
+    try:
+        producer.send('register', 'q/t', 'producer')
+        assert wait_for(lambda: 'q/t' in server.registry.topics)
+        subscriber.send('register', 'q/t', 'subscriber', {'policy': 'block', 'max_outbox': [1]})
+        assert wait_for(lambda: server.registry.topics['q/t']['subscribers'])
+        producer.send('message', 'q/t', 'producer', {'v': 1})
+        assert subscriber.receive()['payload'] == {'v': 1}
+        assert broker.connections[next(iter(server.registry.topics['q/t']['subscribers'].values()))].max_outbox > 1
+    finally:
+        producer.close()
+        subscriber.close()
+
+
+def test_threaded_send_without_dontwait_does_not_stall_on_slow_subscriber(monkeypatch):
+    # Jak na Windows: sendmsg bez MSG_DONTWAIT - o tym, czy send() czeka, decyduje tryb gniazda
+    monkeypatch.setattr(connection, 'SEND_FLAGS', 0)
+    broker, port = start_server('threaded')
+    producer = RawClient(port, 'W-P')
+    stalled = RawClient(port, 'W-S')
+    reader = RawClient(port, 'W-R')
+    stalled.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    try:
+        producer.send('register', 'w/t', 'producer')
+        assert wait_for(lambda: 'w/t' in server.registry.topics)
+        stalled.send('register', 'w/t', 'subscriber')
+        reader.send('register', 'w/t', 'subscriber')
+        assert wait_for(lambda: len(server.registry.topics['w/t']['subscribers']) == 2)
+        for i in range(500):
+            producer.send('message', 'w/t', 'producer', {'v': i, 'd': 'x' * 20000})
+        received = [reader.receive()['payload']['v'] for _ in range(500)]
+        assert received == list(range(500))
+    finally:
+        for client in (producer, stalled, reader):
+            client.close()
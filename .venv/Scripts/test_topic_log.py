@@ -0,0 +1,85 @@
+import os
+import time
+
+import pytest
+
+from topic_log import INDEX_ENTRY, RECORD_HEADER, LogStore, TopicLog
+
+
+@pytest.mark.parametrize('topic', ['.', '..', '', '../x', 'a/../..', 'czujniki.temp'])
+def test_topic_directory_stays_inside_store(tmp_path, topic):
+    root = tmp_path / 'data'
+    store = LogStore(str(root))
+    store.append(topic, b'{"v": 1}')
+    store.sync()
+    directories = os.listdir(root)
+    assert len(directories) == 1
+    assert sorted(os.listdir(root / directories[0])) == ['00000000000000000000.index', '00000000000000000000.log']
+    assert os.listdir(tmp_path) == ['data']
+    assert [bytes(body) for _, body in store.read(topic, 0, 10)] == [b'{"v": 1}']
+
+
+def test_retention_expires_idle_topic_without_new_writes(tmp_path, monkeypatch):
+    store = LogStore(str(tmp_path), retention_seconds=60, retention_interval=0)
+    now = 1000.0
+    monkeypatch.setattr(time, 'time', lambda: now)
+    for i in range(3):
+        store.append('t', b'%d' % i)
+    store.sync()
+    store.enforce_retention()
+    assert store.stats()['t']['first_offset'] == 0
+    now += 61  # Temat bez zapisów - aktywny segment jest zamykany i wygasa przy kolejnym przebiegu
+    assert store.retention_due()
+    store.enforce_retention()
+    assert store.stats()['t']['first_offset'] == 3
+    assert store.read('t', 0, 10) == []
+    store.append('t', b'3')
+    assert [offset for offset, _ in store.read('t', 0, 10)] == [3]
+
+
+def test_recovery_truncates_torn_write(tmp_path):
+    topic_log = TopicLog(str(tmp_path), 1 << 20)
+    for i in range(3):
+        topic_log.append(b'record-%d' % i)
+    topic_log.sync()
+    segment = topic_log.active
+    log_path, index_path, size = segment.log_path, segment.index_path, segment.size
+    segment.close()
+    with open(log_path, 'ab') as file:
+        file.write(RECORD_HEADER.pack(3, 0.0, 100) + b'half')  # Awaria w trakcie zapisu rekordu
+    with open(index_path, 'ab') as file:
+        file.write(INDEX_ENTRY.pack(size, 0.0)[:5])
+
+    recovered = TopicLog(str(tmp_path), 1 << 20)
+    assert recovered.next_offset == 3
+    assert os.path.getsize(log_path) == size
+    assert os.path.getsize(index_path) == 3 * INDEX_ENTRY.size
+    assert recovered.append(b'record-3') == 3
+    assert [bytes(body) for _, body in recovered.read(0, 10)] == [b'record-%d' % i for i in range(4)]
+
+
+def test_size_retention_keeps_active_segment(tmp_path):
+    store = LogStore(str(tmp_path), segment_bytes=100, retention_bytes=250)
+    for i in range(20):
+        store.append('t', b'x' * 40)
+    store.sync()
+    store.enforce_retention()
+    stats = store.stats()['t']
+    assert stats['bytes'] <= 250 and stats['next_offset'] == 20
+    assert [offset for offset, _ in store.read('t', 0, 100)] == list(range(stats['first_offset'], 20))
+    store.retention_bytes = 1
+    store.enforce_retention()
+    assert store.stats()['t']['segments'] == 1  # Aktywny segment zostaje mimo przekroczenia limitu
+    assert store.stats()['t']['next_offset'] == 20
+
+
+def test_offset_for_time(tmp_path, monkeypatch):
+    topic_log = TopicLog(str(tmp_path), 100)
+    for i in range(10):
+        monkeypatch.setattr(time, 'time', lambda: 1000.0 + i)
+        topic_log.append(b'x' * 40)
+    assert len(topic_log.segments) > 1
+    assert topic_log.offset_for_time(0) == 0
+    assert topic_log.offset_for_time(1004) == 4
+    assert topic_log.offset_for_time(1004.5) == 5
+    assert topic_log.offset_for_time(2000) == 10
@@ -0,0 +1,285 @@
+import mmap
+import os
+import struct
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from urllib.parse import quote
+
+RECORD_HEADER = struct.Struct('!QdI')  # offset, timestamp, długość treści
+INDEX_ENTRY = struct.Struct('!Qd')  # pozycja rekordu w pliku .log, timestamp
+
+
+class Segment:
+    # Para plików <offset bazowy>.log (rekordy) i .index (pozycja i czas każdego rekordu).
+    # Odczyt przez mmap - odtwarzane treści to memoryview na mapowanie, bez kopiowania.
+    def __init__(self, directory, base_offset):
+        self.base_offset = base_offset
+        name = f'{base_offset:020d}'
+        self.log_path = os.path.join(directory, name + '.log')
+        self.index_path = os.path.join(directory, name + '.index')
+        self.log_file = open(self.log_path, 'ab+')
+        self.index_file = open(self.index_path, 'ab+')
+        self.positions = array('Q')
+        self.timestamps = array('d')
+        self.map = None
+        self.recover()
+
+    @property
+    def count(self):
+        return len(self.positions)
+
+    @property
+    def next_offset(self):
+        return self.base_offset + self.count
+
+    def recover(self):
+        # Po awarii odcinamy niepełny ostatni rekord z indeksu i logu
+        self.index_file.seek(0)
+        entries = self.index_file.read()
+        self.size = self.log_file.seek(0, os.SEEK_END)
+        valid = 0
+        end = 0
+        for position, timestamp in INDEX_ENTRY.iter_unpack(entries[:len(entries) - len(entries) % INDEX_ENTRY.size]):
+            self.log_file.seek(position)
+            header = self.log_file.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                break
+            _, _, length = RECORD_HEADER.unpack(header)
+            if position + RECORD_HEADER.size + length > self.size:
+                break
+            self.positions.append(position)
+            self.timestamps.append(timestamp)
+            end = position + RECORD_HEADER.size + length
+            valid += 1
+        if valid * INDEX_ENTRY.size != len(entries):
+            self.index_file.truncate(valid * INDEX_ENTRY.size)
+        if end != self.size:
+            self.log_file.truncate(end)
+            self.size = end
+
+    def append(self, offset, timestamp, body):
+        position = self.size
+        self.log_file.write(RECORD_HEADER.pack(offset, timestamp, len(body)))
+        self.log_file.write(body)
+        self.index_file.write(INDEX_ENTRY.pack(position, timestamp))
+        self.positions.append(position)
+        self.timestamps.append(timestamp)
+        self.size += RECORD_HEADER.size + len(body)
+
+    def read(self, offset, limit):
+        start = offset - self.base_offset
+        stop = min(self.count, start + limit)
+        if start >= stop:
+            return []
+        if self.map is None or len(self.map) < self.size:
+            self.log_file.flush()
+            # Starego mapowania nie zamykamy - może jeszcze być w kolejce wyjściowej subskrybenta
+            self.map = mmap.mmap(self.log_file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self.map)
+        records = []
+        for index in range(start, stop):
+            position = self.positions[index] + RECORD_HEADER.size
+            _, _, length = RECORD_HEADER.unpack_from(self.map, self.positions[index])
+            records.append((self.base_offset + index, view[position:position + length]))
+        return records
+
+    def offset_for_time(self, timestamp):
+        return self.base_offset + bisect_left(self.timestamps, timestamp)
+
+    def sync(self):
+        self.log_file.flush()
+        self.index_file.flush()
+        os.fsync(self.log_file.fileno())
+        os.fsync(self.index_file.fileno())
+
+    def close(self):
+        self.log_file.close()
+        self.index_file.close()
+        self.map = None
+
+    def remove(self):
+        self.close()
+        try:
+            os.remove(self.log_path)
+            os.remove(self.index_path)
+        except OSError as e:
+            # Windows nie pozwala usunąć zmapowanego pliku - zostanie usunięty przy kolejnej próbie
+            print(f'Log: Can not remove segment {self.log_path}: {e}')
+            return False
+        return True
+
+
+class TopicLog:
+    def __init__(self, directory, segment_bytes, segment_seconds=None):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        os.makedirs(directory, exist_ok=True)
+        bases = sorted(int(name[:-4]) for name in os.listdir(directory) if name.endswith('.log'))
+        self.segments = [Segment(directory, base) for base in bases] or [Segment(directory, 0)]
+        self.dirty = False
+
+    @property
+    def active(self):
+        return self.segments[-1]
+
+    @property
+    def first_offset(self):
+        return self.segments[0].base_offset
+
+    @property
+    def next_offset(self):
+        return self.active.next_offset
+
+    def roll_due(self, now):
+        # Nowy segment po segment_bytes albo gdy pierwszy rekord aktywnego jest starszy niż segment_seconds
+        if not self.active.count:
+            return False
+        if self.active.size >= self.segment_bytes:
+            return True
+        return bool(self.segment_seconds) and self.active.timestamps[0] <= now - self.segment_seconds
+
+    def roll(self):
+        self.active.sync()
+        self.segments.append(Segment(self.directory, self.next_offset))
+
+    def append(self, body):
+        timestamp = time.time()
+        if self.roll_due(timestamp):
+            self.roll()
+        if self.active.timestamps:
+            timestamp = max(timestamp, self.active.timestamps[-1])  # Indeks czasu musi być posortowany
+        offset = self.next_offset
+        self.active.append(offset, timestamp, body)
+        self.dirty = True
+        return offset
+
+    def read(self, offset, limit):
+        offset = max(offset, self.first_offset)
+        index = bisect_right([segment.base_offset for segment in self.segments], offset) - 1
+        records = []
+        for segment in self.segments[index:]:
+            if len(records) >= limit:
+                break
+            records.extend(segment.read(offset + len(records), limit - len(records)))
+        return records
+
+    def offset_for_time(self, timestamp):
+        for segment in self.segments:
+            if segment.count and segment.timestamps[-1] >= timestamp:
+                return segment.offset_for_time(timestamp)
+        return self.next_offset
+
+    def sync(self):
+        if self.dirty:
+            self.active.sync()
+            self.dirty = False
+
+    def enforce_retention(self, retention_bytes, retention_seconds):
+        # Aktywny segment nigdy nie jest usuwany - stary zamykamy tu, bo temat bez zapisów nie zrobi tego w append()
+        now = time.time()
+        if self.roll_due(now):
+            self.roll()
+        while len(self.segments) > 1:
+            oldest = self.segments[0]
+            too_big = retention_bytes and sum(segment.size for segment in self.segments) > retention_bytes
+            too_old = retention_seconds and oldest.count and oldest.timestamps[-1] < now - retention_seconds
+            if not (too_big or too_old) or not oldest.remove():
+                break
+            self.segments.pop(0)
+
+    def stats(self):
+        return {
+            'first_offset': self.first_offset,
+            'next_offset': self.next_offset,
+            'segments': len(self.segments),
+            'bytes': sum(segment.size for segment in self.segments),
+        }
+
+
+class LogStore:
+    # Dziennik komunikatów per temat; fsync zbiorczo co fsync_interval sekund lub co fsync_messages komunikatów.
+    # Retencja co retention_interval sekund, niezależnie od zapisów. Bez segment_seconds aktywny segment
+    # zamykany jest po retention_seconds, żeby dane tematu bez nowych komunikatów też mogły wygasnąć.
+    def __init__(self, directory, segment_bytes=64 * 1024 * 1024, retention_bytes=None, retention_seconds=None,
+                 fsync_interval=0.2, fsync_messages=1000, segment_seconds=None, retention_interval=1.0):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds or retention_seconds
+        self.retention_bytes = retention_bytes
+        self.retention_seconds = retention_seconds
+        self.retention_interval = retention_interval
+        self.fsync_interval = fsync_interval
+        self.fsync_messages = fsync_messages
+        self.logs = {}
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+        self.last_retention = time.monotonic()
+
+    def log(self, topic, create=False):
+        topic_log = self.logs.get(topic)
+        if topic_log is None:
+            path = os.path.join(self.directory, topic_directory(topic))
+            if not create and not os.path.isdir(path):
+                return None
+            topic_log = self.logs[topic] = TopicLog(path, self.segment_bytes, self.segment_seconds)
+        return topic_log
+
+    def next_offset(self, topic):
+        return self.log(topic, create=True).next_offset
+
+    def append(self, topic, body):
+        offset = self.log(topic, create=True).append(body)
+        self.unsynced += 1
+        if self.unsynced >= self.fsync_messages:
+            self.sync()
+        return offset
+
+    def read(self, topic, offset, limit):
+        topic_log = self.log(topic)
+        return topic_log.read(offset, limit) if topic_log else []
+
+    def offset_for_time(self, topic, timestamp):
+        topic_log = self.log(topic)
+        return topic_log.offset_for_time(timestamp) if topic_log else 0
+
+    @property
+    def retention_enabled(self):
+        return bool(self.retention_bytes or self.retention_seconds or self.segment_seconds)
+
+    def timeout(self):
+        # Ile pętla zdarzeń może spać do najbliższego fsync albo przebiegu retencji
+        now = time.monotonic()
+        deadlines = []
+        if self.unsynced:
+            deadlines.append(self.fsync_interval - (now - self.last_sync))
+        if self.retention_enabled:
+            deadlines.append(self.retention_interval - (now - self.last_retention))
+        return max(0.0, min(deadlines)) if deadlines else None
+
+    def sync_due(self):
+        return self.unsynced and time.monotonic() - self.last_sync >= self.fsync_interval
+
+    def sync(self):
+        for topic_log in self.logs.values():
+            topic_log.sync()
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+    def retention_due(self):
+        return self.retention_enabled and time.monotonic() - self.last_retention >= self.retention_interval
+
+    def enforce_retention(self):
+        for topic_log in self.logs.values():
+            topic_log.enforce_retention(self.retention_bytes, self.retention_seconds)
+        self.last_retention = time.monotonic()
+
+    def stats(self):
+        return {topic: topic_log.stats() for topic, topic_log in self.logs.items()}
+
+
+def topic_directory(topic):
+    # quote() zostawia '.', więc tematy '.' i '..' wskazywałyby katalog danych albo jego rodzica;
+    # pusty temat to sam katalog danych
+    return quote(topic, safe='').replace('.', '%2E') or '%'